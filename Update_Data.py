@@ -16,10 +16,13 @@ from dotenv import load_dotenv
 from supabase import create_client
 
 from pipeline.sync import (
+    read_csv_upload,
+    read_xlsx_first_sheet,
     run_pipeline,
     update_purchase_orders,
     upload_invoice_creation_overrides,
 )
+from invoices_export.ui.cnet import with_cnet_session
 from invoices_export.ui.data_access import fetch_invoice_creation_overrides
 
 
@@ -35,7 +38,13 @@ SUPABASE_TABLE = os.getenv("SUPABASE_TABLE", "invoices_raw")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+@st.cache_resource
+def get_supabase():
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+supabase = get_supabase()
 
 
 # -----------------------------
@@ -56,6 +65,7 @@ def format_utc_to_toronto(ts: str) -> str:
     return dt_toronto.strftime("%B %d, %Y at %I:%M %p")
 
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_last_sync_time():
     res = (
         supabase
@@ -72,6 +82,13 @@ def get_last_sync_time():
     return None
 
 
+@st.cache_data(show_spinner=False)
+def parse_overrides_upload(name: str, data: bytes) -> pd.DataFrame:
+    if name.lower().endswith(".csv"):
+        return read_csv_upload(data)
+    return read_xlsx_first_sheet(data)
+
+
 # -----------------------------
 # UI
 # -----------------------------
@@ -99,7 +116,7 @@ with po_col:
 if export_clicked:
     try:
         with st.spinner("Exporting and uploading..."):
-            df, fee_count = run_pipeline()
+            df, fee_count = with_cnet_session(lambda session: run_pipeline(session=session))
 
         st.cache_data.clear()
         st.success(
@@ -122,7 +139,9 @@ if update_pos_clicked:
         )
 
     try:
-        total_count, po_count = update_purchase_orders(show_po_progress)
+        total_count, po_count = with_cnet_session(
+            lambda session: update_purchase_orders(show_po_progress, session=session)
+        )
         st.cache_data.clear()
         progress.progress(1.0, text="PO update complete")
         st.success(
@@ -155,10 +174,7 @@ uploaded = st.file_uploader(
 
 if uploaded is not None:
     try:
-        if uploaded.name.lower().endswith(".csv"):
-            df_in = pd.read_csv(uploaded)
-        else:
-            df_in = pd.read_excel(uploaded, sheet_name=0)
+        df_in = parse_overrides_upload(uploaded.name, uploaded.getvalue())
 
         st.subheader("Upload preview")
         st.dataframe(df_in.head(50), use_container_width=True, height=320)
@@ -173,7 +189,7 @@ if uploaded is not None:
 
 st.subheader("Current table: invoice_creation_override")
 if st.button("Refresh overrides table"):
-    st.cache_data.clear()
+    fetch_invoice_creation_overrides.clear()
 
 try:
     df_tbl = fetch_invoice_creation_overrides()
@@ -3,115 +3,299 @@ from __future__ import annotations
 import io
 import os
 import re
+import shutil
+import tempfile
+import threading
+import time
 import zipfile
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
+from typing import IO, Optional
 from urllib.parse import urljoin
 
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+
+from invoices_export.cnet_client import (
+    BASE_URL,
+    CNetCredentials,
+    CNetSessionExpired,
+    is_login_redirect,
+    load_cnet_credentials_from_env,
+    login,
+    parse_html,
+)
 
 
 # --------------------- Site constants ---------------------
-BASE = "https://app.master.cnetfranchise.com"
-LOGIN_URL = f"{BASE}/login"
-LOGIN_CHECK_URL = f"{BASE}/login_check"
-MANAGER_HOME = f"{BASE}/manager/"
-DASHBOARD_MARKER = "Homepage"  # adjust if needed
+BASE = BASE_URL
+PDF_DOWNLOAD_WORKERS = 8
+# Finished downloads hold an open file until the writer reaches them; cap how many
+PDF_DOWNLOAD_WINDOW = 2 * PDF_DOWNLOAD_WORKERS
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_SPOOL_MAX_BYTES = 1024 * 1024  # larger PDFs spill to a temp file
+PDF_CACHE_DIR = os.path.expanduser(os.getenv("CNET_PDF_CACHE_DIR", "~/.cnet_pdf_cache"))
+PDF_CACHE_MAX_BYTES = 2 << 30  # least recently used PDFs are evicted past this size
+PDF_CACHE_MAX_AGE_SECONDS = 24 * 3600  # CNET regenerates corrected invoices; download again after this
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024  # readers accept the header anywhere in the first 1 KiB
 
 PDF_TEXT_CANDIDATES = {
     "download pdf", "pdf", "print pdf", "download", "imprimer pdf", "télécharger pdf"
 }
 
-
-# --------------------- Public config ---------------------
-@dataclass(frozen=True)
-class CNetCredentials:
-    user: str
-    password: str
-
-
-def load_cnet_credentials_from_env() -> CNetCredentials:
-    user = os.getenv("CNET_USER")
-    pw = os.getenv("CNET_PASS")
-    if not user or not pw:
-        raise RuntimeError("Missing env vars: CNET_USER / CNET_PASS")
-    return CNetCredentials(user=user, password=pw)
+_SANITIZE_BAD_RE = re.compile(r"[^\w\-. ]+", re.UNICODE)
+_SANITIZE_WS_RE = re.compile(r"\s+")
 
 
 # --------------------- Helpers ---------------------
 def sanitize(s: str, maxlen: int = 80) -> str:
-    s = re.sub(r"[^\w\-. ]+", "_", s or "", flags=re.UNICODE)
-    s = re.sub(r"\s+", "_", s)
+    s = _SANITIZE_BAD_RE.sub("_", s or "")
+    s = _SANITIZE_WS_RE.sub("_", s)
     return s[:maxlen].strip("_")
 
 
-def extract_csrf_from_login(html: str) -> Optional[str]:
-    soup = BeautifulSoup(html, "lxml")
-    token = soup.find("input", {"name": "_csrf_token"})
-    if token and token.has_attr("value"):
-        return token["value"]
-    for name in ("csrf_token", "_token"):
-        el = soup.find("input", {"name": name})
-        if el and el.has_attr("value"):
-            return el["value"]
-    return None
-
-
-def login(creds: CNetCredentials, remember_me: bool = True) -> requests.Session:
-    s = requests.Session()
-    s.headers.update({"User-Agent": "Mozilla/5.0 (compatible; cnet-downloader/1.0)"})
-
-    r = s.get(LOGIN_URL, timeout=15)
-    r.raise_for_status()
-    csrf = extract_csrf_from_login(r.text)
-
-    payload = {"_username": creds.user, "_password": creds.password}
-    if csrf:
-        payload["_csrf_token"] = csrf
-    if remember_me:
-        payload["_remember_me"] = "on"
-
-    resp = s.post(LOGIN_CHECK_URL, data=payload, timeout=20, allow_redirects=True)
-    resp.raise_for_status()
+def sanitize_series(values: pd.Series, maxlen: int = 80, default: str = "") -> pd.Series:
+    """
+    Vectorized sanitize() over a column. Missing/blank inputs and blank
+    results are replaced by `default`.
+    """
+    s = values.astype(object).fillna("").astype(str)
+    s = s.where(s != "", default)
+    s = (
+        s.str.replace(_SANITIZE_BAD_RE, "_", regex=True)
+        .str.replace(_SANITIZE_WS_RE, "_", regex=True)
+        .str.slice(0, maxlen)
+        .str.strip("_")
+    )
+    return s.where(s != "", default)
+
+
+_LOWER = "translate({}, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+_LINK_TEXT = _LOWER.format("normalize-space(.)")
+# `or` short-circuits left to right: the cheap href test runs first and the link
+# text is only normalized for anchors whose href does not mention pdf.
+# Candidates containing "pdf" are already covered by the text substring test.
+_PDF_LINK_XPATH = "//a[@href][{}]/@href".format(
+    " or ".join(
+        [
+            f"contains({_LOWER.format('@href')}, 'pdf')",
+            f"contains({_LINK_TEXT}, 'pdf')",
+            *(f"{_LINK_TEXT} = '{c}'" for c in sorted(PDF_TEXT_CANDIDATES) if "pdf" not in c),
+        ]
+    )
+)
+_PDF_FORM_XPATH = f"//form[contains({_LOWER.format('@action')}, 'pdf')]/@action"
 
-    guard = s.get(MANAGER_HOME, timeout=20)
-    if not (guard.ok and (DASHBOARD_MARKER.lower() in guard.text.lower())):
-        snippet = resp.text[:300].strip().replace("\n", " ")
-        raise RuntimeError(f"Login likely failed; URL={resp.url}. Snippet: {snippet!r}")
 
-    return s
+def extract_csrf_from_login(html: str) -> Optional[str]:
+    root = parse_html(html)
+    if root is None:
+        return None
+    for name in ("_csrf_token", "csrf_token", "_token"):
+        values = root.xpath("//input[@name=$name]/@value", name=name)
+        if values:
+            return values[0]
+    return None
 
 
 def find_pdf_link(show_html: str) -> Optional[str]:
-    soup = BeautifulSoup(show_html, "lxml")
+    root = parse_html(show_html)
+    if root is None:
+        return None
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        text = a.get_text(" ", strip=True).lower()
+    hrefs = root.xpath(_PDF_LINK_XPATH)
+    if hrefs:
+        return hrefs[0]
 
-        if href.lower().endswith(".pdf"):
-            return href
-        if "pdf" in href.lower():
-            return href
-        if text in PDF_TEXT_CANDIDATES or "pdf" in text:
-            return href
+    actions = root.xpath(_PDF_FORM_XPATH)
+    return actions[0] if actions else None
 
-    for form in soup.find_all("form"):
-        action = (form.get("action") or "")
-        if "pdf" in action.lower():
-            return action
 
-    return None
+def is_pdf_file(f: IO[bytes]) -> bool:
+    """True when the file starts like a PDF; the file is rewound either way."""
+    head = f.read(PDF_MAGIC_WINDOW)
+    f.seek(0)
+    return PDF_MAGIC in head
 
 
-def fetch_pdf_bytes(session: requests.Session, pdf_url: str) -> bytes:
+def fetch_pdf_file(session: requests.Session, pdf_url: str) -> IO[bytes]:
+    """
+    Stream a PDF into a spooled temp file (rewound, caller closes) so large
+    documents never sit in memory as one bytes object.
+    Raises ValueError when the server answers with something else, e.g. a
+    login or error page served with status 200.
+    """
     url = urljoin(BASE, pdf_url)
-    with session.get(url, timeout=60, stream=True) as r:
-        r.raise_for_status()
-        return r.content
+    out = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES)
+    try:
+        with session.get(url, timeout=60, stream=True) as r:
+            r.raise_for_status()
+            if is_login_redirect(r):
+                raise CNetSessionExpired("CNET session expired while downloading invoice PDFs")
+            content_type = r.headers.get("Content-Type", "").lower()
+            if content_type.startswith("text/"):
+                raise ValueError(f"Expected a PDF, got Content-Type {content_type!r}")
+            for chunk in r.iter_content(chunk_size=PDF_CHUNK_SIZE):
+                out.write(chunk)
+        out.seek(0)
+        if not is_pdf_file(out):
+            raise ValueError("Response is not a PDF (missing %PDF header)")
+    except Exception:
+        out.close()
+        raise
+    return out
+
+
+def _cached_pdf_path(inv_id: str) -> Optional[str]:
+    if not PDF_CACHE_DIR:
+        return None
+    return os.path.join(PDF_CACHE_DIR, f"{sanitize(inv_id)}.pdf")
+
+
+def open_cached_pdf(inv_id: str) -> Optional[IO[bytes]]:
+    path = _cached_pdf_path(inv_id)
+    if path is None:
+        return None
+    try:
+        f = open(path, "rb")
+        downloaded_at = os.fstat(f.fileno()).st_mtime
+    except OSError:
+        return None
+    now = time.time()
+    if now - downloaded_at > PDF_CACHE_MAX_AGE_SECONDS or not is_pdf_file(f):
+        # Never serve an expired or bad entry (e.g. cached by an older version); download again
+        f.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    try:
+        # atime marks the last use for eviction; mtime keeps the download time for expiry
+        os.utime(path, (now, downloaded_at))
+    except OSError:
+        pass
+    return f
+
+
+def store_cached_pdf(inv_id: str, pdf_file: IO[bytes]) -> None:
+    """
+    Copy a downloaded PDF into the cache and rewind it. Caching is best
+    effort: a disk error never fails the download. Anything that is not a
+    PDF is left out of the cache.
+    """
+    path = _cached_pdf_path(inv_id)
+    if path is None or not is_pdf_file(pdf_file):
+        return
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as out:
+            shutil.copyfileobj(pdf_file, out, PDF_CHUNK_SIZE)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    finally:
+        pdf_file.seek(0)
+
+
+def prune_pdf_cache(max_bytes: int = PDF_CACHE_MAX_BYTES) -> None:
+    """Drop expired PDFs, then evict least recently used ones until the cache fits in max_bytes."""
+    if not PDF_CACHE_DIR or not os.path.isdir(PDF_CACHE_DIR):
+        return
+    expired_before = time.time() - PDF_CACHE_MAX_AGE_SECONDS
+    entries = []
+    total = 0
+    with os.scandir(PDF_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".pdf"):
+                st = entry.stat()
+                if st.st_mtime < expired_before:
+                    try:
+                        os.remove(entry.path)
+                        continue
+                    except OSError:
+                        pass
+                entries.append((st.st_atime, st.st_size, entry.path))
+                total += st.st_size
+    for _atime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def download_invoice_pdf(
+    session: requests.Session, inv_id: str
+) -> tuple[Optional[IO[bytes]], Optional[str], Optional[str]]:
+    """
+    Fetch the show page and PDF for one invoice, serving it from the local
+    PDF cache when a previous run already downloaded it.
+    Returns (pdf_file, None, None) on success, otherwise
+    (None, failure_marker, failure_message).
+    """
+    cached = open_cached_pdf(inv_id)
+    if cached is not None:
+        return cached, None, None
+
+    show_url = f"{BASE}/manager/invoices/{inv_id}/show"
+    try:
+        show_resp = session.get(show_url, timeout=30)
+        show_resp.raise_for_status()
+    except Exception as e:
+        return (
+            None,
+            "FAILED_SHOW",
+            f"Failed to open show page for invoice {inv_id}\nURL: {show_url}\nError: {e}\n",
+        )
+    if is_login_redirect(show_resp):
+        # Every later invoice would fail the same way; stop instead of writing markers
+        raise CNetSessionExpired("CNET session expired while opening invoice pages")
+
+    pdf_href = find_pdf_link(show_resp.text)
+    if not pdf_href:
+        return (
+            None,
+            "FAILED_NO_PDF_LINK",
+            f"No PDF link found for invoice {inv_id}\nURL: {show_url}\n",
+        )
+
+    try:
+        pdf_file = fetch_pdf_file(session, pdf_href)
+    except CNetSessionExpired:
+        raise
+    except Exception as e:
+        return (
+            None,
+            "FAILED_PDF",
+            f"Failed to download PDF for invoice {inv_id}\nPDF href: {pdf_href}\nError: {e}\n",
+        )
+
+    store_cached_pdf(inv_id, pdf_file)
+    return pdf_file, None, None
+
+
+def _discard_pending(pending) -> None:
+    """Cancel queued downloads and close the files of those that already finished."""
+    for _job, future in pending:
+        future.cancel()
+    for _job, future in pending:
+        if future.cancelled():
+            continue
+        try:
+            pdf_file = future.result()[0]
+        except Exception:
+            continue
+        if pdf_file is not None:
+            pdf_file.close()
 
 
 # --------------------- Public API ---------------------
@@ -120,6 +304,7 @@ def build_past_due_invoices_zip_by_vendor_buyer(
     creds: Optional[CNetCredentials] = None,
     *,
     include_fail_markers: bool = True,
+    session: Optional[requests.Session] = None,
 ) -> tuple[bytes, str]:
     """
     Build a ZIP with PDFs organized as Vendor/Buyer/*.pdf
@@ -135,6 +320,10 @@ def build_past_due_invoices_zip_by_vendor_buyer(
     Optional:
       - work_description
 
+    Pass an already logged-in `session` to skip the login round trips.
+    PDFs are cached under PDF_CACHE_DIR (CNET_PDF_CACHE_DIR) by invoice_id,
+    so repeated runs only download invoices they have not seen yet.
+
     Returns: (zip_bytes, zip_filename)
     """
     if df is None or df.empty:
@@ -145,64 +334,67 @@ def build_past_due_invoices_zip_by_vendor_buyer(
     if missing:
         raise ValueError(f"Missing required columns: {sorted(missing)}")
 
-    if creds is None:
-        creds = load_cnet_credentials_from_env()
+    if session is None:
+        if creds is None:
+            creds = load_cnet_credentials_from_env()
+        session = login(creds, remember_me=True)
 
-    session = login(creds, remember_me=True)
+    now = datetime.now()
+    ts = now.strftime("%Y%m%d-%H%M%S")
+    zip_name = f"past_due_invoices_by_vendor_buyer_{ts}.zip"
 
-    df2 = df.copy()
-    df2["invoice_id"] = df2["invoice_id"].astype(str).str.strip()
-    if "work_description" not in df2.columns:
-        df2["work_description"] = ""
+    # Path parts as plain arrays; the caller's frame is never copied.
+    if "work_description" in df.columns:
+        work_description = df["work_description"]
+    else:
+        work_description = pd.Series("", index=df.index)
+    inv_ids = df["invoice_id"].astype(str).str.strip().to_numpy()
+    vendors = sanitize_series(df["vendor_company_name"], maxlen=60, default="(null)").to_numpy()
+    buyers = sanitize_series(df["buyer_company_name"], maxlen=60, default="(null)").to_numpy()
+    works = sanitize_series(work_description, maxlen=60).to_numpy()
 
-    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    zip_name = f"past_due_invoices_by_vendor_buyer_{ts}.zip"
+    jobs = [job for job in zip(inv_ids, vendors, buyers, works) if job[0]]
 
     buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for _, row in df2.iterrows():
-            inv_id = str(row.get("invoice_id", "")).strip()
-            if not inv_id:
-                continue
-
-            vendor = sanitize(str(row.get("vendor_company_name") or "(null)"), maxlen=60) or "(null)"
-            buyer = sanitize(str(row.get("buyer_company_name") or "(null)"), maxlen=60) or "(null)"
-            work = sanitize(str(row.get("work_description") or ""), maxlen=60)
-
-            show_url = f"{BASE}/manager/invoices/{inv_id}/show"
-            try:
-                show_resp = session.get(show_url, timeout=30)
-                show_resp.raise_for_status()
-            except Exception as e:
-                if include_fail_markers:
-                    z.writestr(
-                        f"{vendor}/{buyer}/FAILED_SHOW_{inv_id}.txt",
-                        f"Failed to open show page for invoice {inv_id}\nURL: {show_url}\nError: {e}\n",
+    with (
+        ThreadPoolExecutor(max_workers=PDF_DOWNLOAD_WORKERS) as executor,
+        zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z,
+    ):
+        # Downloads overlap on the pool; ZIP writes stay on this thread, in row order.
+        # At most PDF_DOWNLOAD_WINDOW jobs are in flight, so open cache files and
+        # spooled downloads stay bounded however many invoices there are.
+        pending = deque()
+        job_iter = iter(jobs)
+        for job in job_iter:
+            pending.append((job, executor.submit(download_invoice_pdf, session, job[0])))
+            if len(pending) >= PDF_DOWNLOAD_WINDOW:
+                break
+
+        try:
+            while pending:
+                (inv_id, vendor, buyer, work), future = pending.popleft()
+                next_job = next(job_iter, None)
+                if next_job is not None:
+                    pending.append(
+                        (next_job, executor.submit(download_invoice_pdf, session, next_job[0]))
                     )
-                continue
-
-            pdf_href = find_pdf_link(show_resp.text)
-            if not pdf_href:
-                if include_fail_markers:
-                    z.writestr(
-                        f"{vendor}/{buyer}/FAILED_NO_PDF_LINK_{inv_id}.txt",
-                        f"No PDF link found for invoice {inv_id}\nURL: {show_url}\n",
-                    )
-                continue
-
-            try:
-                pdf_bytes = fetch_pdf_bytes(session, pdf_href)
-            except Exception as e:
-                if include_fail_markers:
-                    z.writestr(
-                        f"{vendor}/{buyer}/FAILED_PDF_{inv_id}.txt",
-                        f"Failed to download PDF for invoice {inv_id}\nPDF href: {pdf_href}\nError: {e}\n",
-                    )
-                continue
-
-            filename = f"invoice_{inv_id}_{work or 'document'}.pdf"
-            zip_path = f"{vendor}/{buyer}/{filename}"
-            z.writestr(zip_path, pdf_bytes)
 
+                pdf_file, marker, message = future.result()
+                if pdf_file is None:
+                    if include_fail_markers:
+                        z.writestr(f"{vendor}/{buyer}/{marker}_{inv_id}.txt", message)
+                    continue
+
+                filename = f"invoice_{inv_id}_{work or 'document'}.pdf"
+                # PDFs are already compressed; store them as-is and only deflate the text markers.
+                info = zipfile.ZipInfo(f"{vendor}/{buyer}/{filename}", date_time=now.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                with pdf_file, z.open(info, "w", force_zip64=True) as zf:
+                    shutil.copyfileobj(pdf_file, zf, PDF_CHUNK_SIZE)
+        except BaseException:
+            _discard_pending(pending)
+            raise
+
+    prune_pdf_cache()
     buf.seek(0)
     return buf.read(), zip_name
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from urllib.parse import urljoin
+
+import requests
+from lxml import etree, html as lxml_html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_URL = "https://app.master.cnetfranchise.com"
+LOGIN_URL = f"{BASE_URL}/login"
+HTTP_POOL_SIZE = 32
+
+
+@dataclass(frozen=True)
+class CNetCredentials:
+    user: str
+    password: str
+
+
+class CNetSessionExpired(RuntimeError):
+    """The CNET session was bounced to /login; log in again and retry."""
+
+
+def load_cnet_credentials_from_env() -> CNetCredentials:
+    user = os.getenv("CNET_USER")
+    pw = os.getenv("CNET_PASS")
+    if not user or not pw:
+        raise RuntimeError("Missing env vars: CNET_USER / CNET_PASS")
+    return CNetCredentials(user=user, password=pw)
+
+
+def parse_html(html: str):
+    """Parse an HTML document with lxml; returns None when there is nothing to parse."""
+    if not html or not html.strip():
+        return None
+    parser = lxml_html.HTMLParser(encoding="utf-8")
+    try:
+        return lxml_html.document_fromstring(html.encode("utf-8"), parser=parser)
+    except etree.ParserError:
+        return None
+
+
+def is_login_redirect(response) -> bool:
+    """True when a request ended on the login page, i.e. the session is not logged in."""
+    return "/login" in (response.url or "")
+
+
+def login(creds: CNetCredentials, remember_me: bool = True) -> requests.Session:
+    """
+    Log in through the CNET login form and return the authenticated session.
+    Shared by the export pipeline and the invoice ZIP download.
+    """
+    s = requests.Session()
+    s.headers.update(
+        {
+            "User-Agent": "Mozilla/5.0",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        }
+    )
+    # Large keep-alive pool for the parallel PDF downloads, with backoff on throttling/5xx.
+    retries = Retry(
+        total=5,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+    )
+    s.mount(
+        "https://",
+        HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retries),
+    )
+
+    # 1) GET login page (to fetch cookies + CSRF/hidden inputs)
+    r = s.get(LOGIN_URL, timeout=60)
+    r.raise_for_status()
+    root = parse_html(r.text)
+    forms = root.xpath("//form") if root is not None else []
+    if not forms:
+        raise RuntimeError("Login page has no <form>. Login flow likely changed.")
+    form = forms[0]
+    post_url = urljoin(BASE_URL, form.get("action") or "/login")
+
+    # Hidden and submit inputs carry the CSRF token and any other form state
+    payload = {
+        inp.get("name"): inp.get("value") or ""
+        for inp in form.xpath(".//input[@name]")
+        if (inp.get("type") or "").lower() in ("hidden", "submit")
+    }
+    payload["_username"] = creds.user
+    payload["_password"] = creds.password
+    if remember_me:
+        payload["_remember_me"] = "on"
+
+    # 2) POST login (follow redirects)
+    resp = s.post(post_url, data=payload, allow_redirects=True, timeout=60)
+    resp.raise_for_status()
+
+    # If we got bounced back to /login, auth failed
+    if is_login_redirect(resp):
+        raise RuntimeError("Login appears to have failed (redirected back to /login).")
+
+    return s
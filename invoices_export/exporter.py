@@ -15,12 +15,33 @@ from dotenv import load_dotenv
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-BASE_URL = "https://app.master.cnetfranchise.com"
-LOGIN_URL = f"{BASE_URL}/login"
+from invoices_export.cnet_client import (
+    BASE_URL,
+    CNetCredentials,
+    CNetSessionExpired,
+    is_login_redirect,
+    login,
+    parse_html,
+)
+
 INVOICES_URL = f"{BASE_URL}/manager/invoices"
 FEES_EXPORT_URL = f"{BASE_URL}/manager/invoices/export/fees"
 PO_REQUEST_WORKERS = 8
 
+_EXPORT_RE = re.compile(r"export", re.I)
+_EXPORT_SEARCH_RESULTS_RE = re.compile(r"export\s+search\s+results", re.I)
+_ONCLICK_URL_RE = re.compile(r"""['"](/[^'"]+)['"]""")
+_PARENTHESIZED_RE = re.compile(r"^\((.*)\)$")
+_PO_NUMBER_LABEL_RE = re.compile(r"^PO\s+Number\s*:", re.I)
+
+_EXPORT_ATTRS = ("href", "data-href", "data-url", "data-export-url")
+_EXPORT_TAGS_XPATH = "//*[{}]".format(
+    " or ".join(
+        f"contains(translate(@{attr}, 'EXPORT', 'export'), 'export')"
+        for attr in (*_EXPORT_ATTRS, "onclick")
+    )
+)
+
 
 def _pick_export_url(html: str, base_url: str) -> str:
     """
@@ -29,28 +50,28 @@ def _pick_export_url(html: str, base_url: str) -> str:
       - <a> with text like "Export search results"
       - elements with href/data-href/data-url/onclick containing "export"
     """
-    soup = BeautifulSoup(html, "html.parser")
+    root = parse_html(html)
+    tags = root.xpath(_EXPORT_TAGS_XPATH) if root is not None else []
+    anchors = root.xpath("//a[@href != '']") if root is not None else []
 
     # 1) Direct <a> by text
-    for a in soup.find_all("a"):
-        txt = (a.get_text(" ", strip=True) or "")
-        if re.search(r"export\s+search\s+results", txt, flags=re.I):
-            href = a.get("href")
-            if href:
-                return urljoin(base_url, href)
+    for a in anchors:
+        txt = " ".join(t.strip() for t in a.itertext() if t.strip())
+        if _EXPORT_SEARCH_RESULTS_RE.search(txt):
+            return urljoin(base_url, a.get("href"))
 
     # 2) Any tag with href/data-* that looks export-ish
     candidates = []
-    for tag in soup.find_all(True):
-        for attr in ("href", "data-href", "data-url", "data-export-url"):
+    for tag in tags:
+        for attr in _EXPORT_ATTRS:
             val = tag.get(attr)
-            if val and re.search(r"export", val, flags=re.I):
+            if val and _EXPORT_RE.search(val):
                 candidates.append(val)
 
         onclick = tag.get("onclick")
-        if onclick and re.search(r"export", onclick, flags=re.I):
+        if onclick and _EXPORT_RE.search(onclick):
             # Try to extract a quoted URL from onclick="location.href='...'"
-            m = re.search(r"""['"](/[^'"]+)['"]""", onclick)
+            m = _ONCLICK_URL_RE.search(onclick)
             if m:
                 candidates.append(m.group(1))
 
@@ -72,88 +93,51 @@ def _authenticated_session() -> requests.Session:
     if not user or not pw:
         raise RuntimeError("Missing CNET_USER or CNET_PASS")
 
-    s = requests.Session()
-    s.headers.update(
-        {
-            "User-Agent": "Mozilla/5.0",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        }
-    )
-
-    # 1) GET login page (to fetch cookies + CSRF/hidden inputs)
-    r = s.get(LOGIN_URL, timeout=60)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
+    return login(CNetCredentials(user, pw), remember_me=False)
 
-    form = soup.find("form")
-    if not form:
-        raise RuntimeError("Login page has no <form>. Login flow likely changed.")
 
-    action = form.get("action") or "/login"
-    post_url = urljoin(BASE_URL, action)
-
-    # Collect hidden inputs (CSRF tokens, etc.)
-    payload = {}
-    for inp in form.select("input"):
-        name = inp.get("name")
-        if not name:
-            continue
-        itype = (inp.get("type") or "").lower()
-        if itype in ("hidden", "submit"):
-            payload[name] = inp.get("value") or ""
-
-    # Add credentials in the same fields your Playwright code used
-    payload["_username"] = user
-    payload["_password"] = pw
-
-    # 2) POST login (follow redirects)
-    r2 = s.post(post_url, data=payload, allow_redirects=True, timeout=60)
-    r2.raise_for_status()
-
-    # Basic sanity: if we got bounced back to /login, auth failed
-    if "/login" in r2.url:
-        raise RuntimeError("Login appears to have failed (redirected back to /login).")
-
-    return s
+def _get(session: requests.Session, url: str, timeout: int) -> requests.Response:
+    """GET a CNET page; raises CNetSessionExpired when the login cookie went stale."""
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    if is_login_redirect(response):
+        raise CNetSessionExpired(f"CNET session expired while fetching {url}")
+    return response
 
 
 def _login_and_download_csv_bytes() -> bytes:
     s = _authenticated_session()
 
     # 3) Load invoices page
-    r3 = s.get(INVOICES_URL, timeout=60)
-    r3.raise_for_status()
+    r3 = _get(s, INVOICES_URL, timeout=60)
 
     # 4) Find export endpoint in invoices HTML
     export_url = _pick_export_url(r3.text, BASE_URL)
 
     # 5) Download CSV bytes
-    dl = s.get(export_url, timeout=120)
-    dl.raise_for_status()
+    dl = _get(s, export_url, timeout=120)
 
     return dl.content
 
 
-def _login_and_download_csv_exports_bytes() -> tuple[bytes, bytes]:
+def _login_and_download_csv_exports_bytes(
+    session: requests.Session | None = None,
+) -> tuple[bytes, bytes]:
     """Download the standard and fee exports using the same authenticated session."""
-    s = _authenticated_session()
+    s = session or _authenticated_session()
 
-    invoices_page = s.get(INVOICES_URL, timeout=60)
-    invoices_page.raise_for_status()
+    invoices_page = _get(s, INVOICES_URL, timeout=60)
     export_url = _pick_export_url(invoices_page.text, BASE_URL)
 
-    invoices_response = s.get(export_url, timeout=120)
-    invoices_response.raise_for_status()
-
-    fees_response = s.get(FEES_EXPORT_URL, timeout=120)
-    fees_response.raise_for_status()
+    invoices_response = _get(s, export_url, timeout=120)
+    fees_response = _get(s, FEES_EXPORT_URL, timeout=120)
 
     return invoices_response.content, fees_response.content
 
 
 def _parse_money(value: str) -> Decimal:
     cleaned = (value or "").strip().replace(",", "").replace("$", "")
-    cleaned = re.sub(r"^\((.*)\)$", r"-\1", cleaned)
+    cleaned = _PARENTHESIZED_RE.sub(r"-\1", cleaned)
     try:
         return Decimal(cleaned)
     except InvalidOperation:
@@ -195,11 +179,14 @@ def _extract_payment_summary(html: str) -> dict[str, float | int]:
     }
 
 
-def get_payment_summaries(invoice_ids: list[str]) -> dict[str, dict[str, float | int]]:
+def get_payment_summaries(
+    invoice_ids: list[str],
+    session: requests.Session | None = None,
+) -> dict[str, dict[str, float | int]]:
     if not invoice_ids:
         return {}
 
-    s = _authenticated_session()
+    s = session or _authenticated_session()
     out = {}
 
     for invoice_id in invoice_ids:
@@ -208,8 +195,7 @@ def get_payment_summaries(invoice_ids: list[str]) -> dict[str, dict[str, float |
             continue
 
         show_url = f"{BASE_URL}/manager/invoices/{inv}/show"
-        r = s.get(show_url, timeout=60)
-        r.raise_for_status()
+        r = _get(s, show_url, timeout=60)
         out[inv] = _extract_payment_summary(r.text)
 
     return out
@@ -219,7 +205,7 @@ def _extract_po_number(html: str) -> str | None:
     soup = BeautifulSoup(html, "html.parser")
     for paragraph in soup.find_all("p"):
         text = paragraph.get_text(" ", strip=True)
-        if not re.match(r"^PO\s+Number\s*:", text, flags=re.I):
+        if not _PO_NUMBER_LABEL_RE.match(text):
             continue
 
         strong = paragraph.find("strong")
@@ -231,6 +217,7 @@ def _extract_po_number(html: str) -> str | None:
 def get_purchase_order_numbers(
     invoice_ids: list[str],
     progress_callback: Callable[[int, int], None] | None = None,
+    session: requests.Session | None = None,
 ) -> list[dict[str, str | None]]:
     """Fetch PO numbers for invoice IDs while reusing one authenticated login."""
     normalized_ids = [str(invoice_id).strip() for invoice_id in invoice_ids]
@@ -238,7 +225,7 @@ def get_purchase_order_numbers(
     if not normalized_ids:
         return []
 
-    authenticated = _authenticated_session()
+    authenticated = session or _authenticated_session()
     cookies = authenticated.cookies.get_dict()
     headers = dict(authenticated.headers)
     thread_state = threading.local()
@@ -262,10 +249,7 @@ def get_purchase_order_numbers(
 
     def fetch_one(invoice_id: str) -> dict[str, str | None]:
         url = f"{BASE_URL}/manager/invoices/{invoice_id}/show"
-        response = worker_session().get(url, timeout=60)
-        response.raise_for_status()
-        if "/login" in response.url:
-            raise RuntimeError("CNET session expired while fetching invoice pages")
+        response = _get(worker_session(), url, timeout=60)
         return {
             "invoice_id": invoice_id,
             "po_number": _extract_po_number(response.text),
@@ -283,6 +267,11 @@ def get_purchase_order_numbers(
             invoice_id = futures[future]
             try:
                 records.append(future.result())
+            except CNetSessionExpired:
+                # Every remaining page would fail the same way; log in again instead
+                for pending in futures:
+                    pending.cancel()
+                raise
             except Exception as exc:
                 failures.append(f"{invoice_id}: {exc}")
             if progress_callback:
@@ -304,8 +293,8 @@ async def _export_csv_bytes():
     return _login_and_download_csv_bytes()
 
 
-async def _export_csv_exports_bytes():
-    return _login_and_download_csv_exports_bytes()
+async def _export_csv_exports_bytes(session: requests.Session | None = None):
+    return _login_and_download_csv_exports_bytes(session)
 
 
 def get_csv_bytes():
@@ -313,6 +302,6 @@ def get_csv_bytes():
     return asyncio.run(_export_csv_bytes())
 
 
-def get_csv_exports_bytes() -> tuple[bytes, bytes]:
-    """Return (standard invoices CSV, invoice fees CSV)."""
-    return asyncio.run(_export_csv_exports_bytes())
+def get_csv_exports_bytes(session: requests.Session | None = None) -> tuple[bytes, bytes]:
+    """Return (standard invoices CSV, invoice fees CSV). Reuses `session` when given."""
+    return asyncio.run(_export_csv_exports_bytes(session))
@@ -1,12 +1,55 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 import altair as alt
 import plotly.express as px
 
 
+DAYS_CHART_CAP = 365  # days-since-issue bars beyond this collapse into one "365+" bar
+
+
 def _amount_col(df: pd.DataFrame) -> str:
     return "open_amount_with_taxes" if "open_amount_with_taxes" in df.columns else "total_amount_with_taxes"
 
+def classify_days(days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row aging classification in two vectorized passes:
+      bin_idx: 30-day bin index (days // 30), -1 for negative ages
+      past_due_flag: 1 when days > 0, else 0
+    """
+    bin_idx = np.floor_divide(days, 30).astype(np.int64)
+    bin_idx[bin_idx < 0] = -1
+    return bin_idx, (days > 0).astype(np.uint8)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _past_due_bins_agg(days: np.ndarray, amounts: np.ndarray) -> tuple[pd.DataFrame, int]:
+    """
+    Count and amount per 30-day bin [start, start + 29], plus the upper edge of
+    the color scale. Takes plain arrays so reruns with unchanged filters hit the cache.
+    """
+    max_edge = (int(days.max()) // 30 + 1) * 30
+    n_bins = max(max_edge // 30, 0)
+    labels = np.array([f"{start}-{start + 29}" for start in range(0, max_edge, 30)])
+
+    # The bin index is the integer quotient, so no pd.cut/label-parsing round trip is needed.
+    idx, _ = classify_days(days)
+    keep = idx >= 0
+    idx = idx[keep]
+    count = np.bincount(idx, minlength=n_bins)
+    amount = np.bincount(idx, weights=np.nan_to_num(amounts[keep]), minlength=n_bins)
+
+    used = np.flatnonzero(count)
+    by_bin = pd.DataFrame(
+        {
+            "aging_bin": labels[used],
+            "bin_start": used * 30,
+            "count": count[used],
+            "amount": amount[used],
+        }
+    )
+    return by_bin, max_edge
+
 def render_past_due_bins(past_due_df: pd.DataFrame):
     st.subheader("Past Due Aging")
 
@@ -14,49 +57,24 @@ def render_past_due_bins(past_due_df: pd.DataFrame):
         st.warning("No past-due rows under current filters.")
         return
 
-    tmp = past_due_df.dropna(subset=["days_since_issue"]).copy()
+    tmp = past_due_df.dropna(subset=["days_since_issue"])
     if tmp.empty:
         st.warning("Past-due rows have no days_since_issue.")
         return
 
-    max_days = int(tmp["days_since_issue"].max())
-    max_edge = ((max_days // 30) + 1) * 30
-    edges = list(range(0, max_edge + 30, 30))
-    labels = [f"{edges[i]}-{edges[i+1]-1}" for i in range(len(edges) - 1)]
-
-    tmp["aging_bin"] = pd.cut(
-        tmp["days_since_issue"],
-        bins=edges,
-        labels=labels,
-        right=False,
-        include_lowest=True,
-    )
-
-    tmp["bin_start"] = tmp["aging_bin"].astype(str).str.split("-").str[0].astype(int)
-
-    count_by = (
-        tmp.groupby(["aging_bin", "bin_start"])
-        .size()
-        .reset_index(name="count")
-        .sort_values("bin_start")
-    )
-
-    amount_col = _amount_col(tmp)
-    amt_by = (
-        tmp.groupby(["aging_bin", "bin_start"])[amount_col]
-        .sum()
-        .reset_index(name="amount")
-        .sort_values("bin_start")
+    by_bin, max_edge = _past_due_bins_agg(
+        tmp["days_since_issue"].to_numpy(dtype=float),
+        tmp[_amount_col(tmp)].to_numpy(dtype=float, na_value=np.nan),
     )
 
-    x_order = [str(x) for x in count_by["aging_bin"].tolist()]
+    x_order = [str(x) for x in by_bin["aging_bin"].tolist()]
 
     left, right = st.columns(2)
 
     # keep exact colors/scale from your original
     with left:
         st.altair_chart(
-            alt.Chart(count_by)
+            alt.Chart(by_bin)
             .mark_bar()
             .encode(
                 x=alt.X("aging_bin:N", sort=x_order),
@@ -74,7 +92,7 @@ def render_past_due_bins(past_due_df: pd.DataFrame):
 
     with right:
         st.altair_chart(
-            alt.Chart(amt_by)
+            alt.Chart(by_bin)
             .mark_bar()
             .encode(
                 x=alt.X("aging_bin:N", sort=x_order),
@@ -90,6 +108,46 @@ def render_past_due_bins(past_due_df: pd.DataFrame):
             use_container_width=True,
         )
 
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _split_by_group_agg(
+    tmp: pd.DataFrame, group_col: str, past_due_col: str, amount_col: str, top_n: int
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (group, status) amounts with their share of the group total for the top_n groups,
+    plus those group totals in rank order. Takes only the three columns it reads,
+    without missing values, so reruns with unchanged filters hit the cache.
+    """
+    # Rank groups first so the (group, status) aggregation only sees the top_n groups.
+    # Factorizing once lets ranking and top-N membership work on integer codes.
+    codes, groups = pd.factorize(tmp[group_col])
+    sums = np.bincount(codes, weights=tmp[amount_col].to_numpy(dtype=float), minlength=len(groups))
+    top = np.argsort(-sums, kind="stable")[:top_n]
+    top_totals = pd.Series(sums[top], index=groups[top])
+
+    in_top = np.zeros(len(groups), dtype=bool)
+    in_top[top] = True
+    tmp = tmp[in_top[codes]].copy()
+
+    # True = Past Due
+    is_past_due = tmp[past_due_col].to_numpy(dtype=bool)
+    tmp["status"] = np.where(is_past_due, "Past Due", "Not Past Due")
+
+    # Robust ordering for stacks (controls bar + label alignment)
+    tmp["status_order"] = np.where(is_past_due, 0, 1).astype(np.int8)
+
+    g = (
+        tmp.groupby([group_col, "status", "status_order"], as_index=False, observed=True, sort=False)[amount_col]
+        .sum()
+        .rename(columns={group_col: "group", amount_col: "amount"})
+    )
+
+    g["total"] = top_totals.reindex(g["group"]).to_numpy()
+    g["pct"] = g["amount"] / g["total"]
+    totals = top_totals.rename_axis("group").reset_index(name="total")
+    return g, totals
+
+
 def render_split_100pct_with_pie(
     df: pd.DataFrame,
     group_by: str = "vendor",  # "vendor" or "buyer"
@@ -126,38 +184,13 @@ def render_split_100pct_with_pie(
         st.error(f"Missing columns: {sorted(missing)}")
         return
 
-    tmp = df.dropna(subset=[group_col, past_due_col, amount_col]).copy()
+    tmp = df[[group_col, past_due_col, amount_col]].dropna()
     if tmp.empty:
         st.warning("No usable rows after dropping missing values.")
         return
 
-    # True = Past Due
-    tmp["status"] = tmp[past_due_col].map({True: "Past Due", False: "Not Past Due"})
-
-    # Robust ordering for stacks (controls bar + label alignment)
-    tmp["status_order"] = tmp["status"].map({"Past Due": 0, "Not Past Due": 1})
-
-    g = (
-        tmp.groupby([group_col, "status", "status_order"], as_index=False)[amount_col]
-        .sum()
-        .rename(columns={group_col: "group", amount_col: "amount"})
-    )
-
-    totals = (
-        g.groupby("group", as_index=False)["amount"]
-        .sum()
-        .rename(columns={"amount": "total"})
-    )
-
-    g = g.merge(totals, on="group", how="left")
-    g["pct"] = g["amount"] / g["total"]
-
-    # Keep only top_n groups
-    top_groups = totals.sort_values("total", ascending=False).head(top_n)["group"].tolist()
-    g = g[g["group"].isin(top_groups)]
-    totals = totals[totals["group"].isin(top_groups)]
-
-    order = totals.sort_values("total", ascending=False)["group"].tolist()
+    g, totals = _split_by_group_agg(tmp, group_col, past_due_col, amount_col, top_n)
+    order = totals["group"].tolist()
 
     # ---------------- TOP: VERTICAL BARS (TOTALS) ----------------
     # Thicker bars + chart can grow in height (no scroll container here)
@@ -193,19 +226,20 @@ def render_split_100pct_with_pie(
         range=["#e74c3c", "#2ecc71"],
     )
 
+    # One data reference for both layers; the stack offsets (x0/x1) are computed
+    # once on the layer and shared by the bars and their labels.
     bars = (
-        alt.Chart(g)
+        alt.Chart()
         .mark_bar(size=18)
         .encode(
             y=alt.Y("group:N", sort=order, title=group_by.title()),
             x=alt.X(
-                "pct:Q",
-                stack="normalize",
+                "x0:Q",
                 title="Share of unpaid amount",
                 axis=alt.Axis(format="%"),
             ),
+            x2="x1:Q",
             color=alt.Color("status:N", scale=color_scale, title=None),
-            order=alt.Order("status_order:Q", sort="ascending"),
             tooltip=[
                 alt.Tooltip("group:N", title=group_by.title()),
                 alt.Tooltip("status:N", title="Status"),
@@ -214,18 +248,11 @@ def render_split_100pct_with_pie(
                 alt.Tooltip("total:Q", title="Group total", format=",.2f"),
             ],
         )
-        .properties(height=stacked_height)
     )
 
     labels = (
-        alt.Chart(g)
+        alt.Chart()
         .transform_filter("datum.pct >= 0.06")
-        .transform_stack(
-            stack="pct",
-            groupby=["group"],
-            sort=[alt.SortField("status_order", order="ascending")],
-            as_=["x0", "x1"],
-        )
         .transform_calculate(
             x_mid="(datum.x0 + datum.x1) / 2",
             label='format(datum.pct, ".0%")',
@@ -236,16 +263,33 @@ def render_split_100pct_with_pie(
             x=alt.X("x_mid:Q"),
             text="label:N",
         )
+    )
+
+    stacked = (
+        alt.layer(bars, labels, data=g)
+        .transform_stack(
+            stack="pct",
+            groupby=["group"],
+            sort=[alt.SortField("status_order", order="ascending")],
+            as_=["x0", "x1"],
+        )
         .properties(height=stacked_height)
     )
 
-    st.altair_chart(bars + labels, use_container_width=True)
+    st.altair_chart(stacked, use_container_width=True)
 
 
 LIGHT_GREEN = "#C8E6C9"  # Current
 LIGHT_RED = "#FFCDD2"    # Past Due
 
 
+def _rollup_input_hash(df: pd.DataFrame) -> tuple:
+    """Hash only the columns _metrics_rollup reads, so unrelated columns never miss the cache."""
+    cols = [c for c in ("past_due", "invoice_type", _amount_col(df)) if c in df.columns]
+    return len(df), tuple(cols), int(pd.util.hash_pandas_object(df[cols], index=False).sum())
+
+
+@st.cache_data(ttl=300, show_spinner=False, hash_funcs={pd.DataFrame: _rollup_input_hash})
 def _metrics_rollup(df_f: pd.DataFrame) -> pd.DataFrame:
     """
     Returns a 4-row table:
@@ -260,27 +304,28 @@ def _metrics_rollup(df_f: pd.DataFrame) -> pd.DataFrame:
     if missing:
         raise ValueError(f"Missing columns: {sorted(missing)}")
 
-    tmp = df_f.dropna(subset=["past_due", "invoice_type", amount_col]).copy()
-    tmp["status"] = tmp["past_due"].map({True: "Past Due", False: "Current"})
+    tmp = df_f.dropna(subset=["past_due", "invoice_type", amount_col])
 
-    # keep only the two types you want (optional but helps avoid surprises)
-    tmp = tmp[tmp["invoice_type"].isin(["Regular", "One Shot"])]
+    # Categoricals with observed=False emit all 4 combos directly (so treemap
+    # doesn't disappear when empty); types outside the two categories drop out.
+    status = pd.Series(
+        pd.Categorical.from_codes(
+            tmp["past_due"].to_numpy(dtype=bool).astype(np.int8),
+            categories=["Current", "Past Due"],
+        ),
+        index=tmp.index,
+    )
+    invoice_type = tmp["invoice_type"].astype(pd.CategoricalDtype(["Regular", "One Shot"]))
 
     out = (
-        tmp.groupby(["status", "invoice_type"], as_index=False)
-        .agg(
-            amount=(amount_col, "sum"),
-            count=("invoice_type", "size"),
-        )
+        tmp[amount_col]
+        .groupby([status.rename("status"), invoice_type], observed=False)
+        .agg(amount="sum", count="size")
+        .reset_index()
+        .fillna({"amount": 0.0, "count": 0})
     )
-
-    # ensure all 4 combos exist (so treemap doesn't disappear when empty)
-    full = pd.MultiIndex.from_product(
-        [["Current", "Past Due"], ["Regular", "One Shot"]],
-        names=["status", "invoice_type"],
-    ).to_frame(index=False)
-
-    out = full.merge(out, on=["status", "invoice_type"], how="left").fillna({"amount": 0.0, "count": 0})
+    out["status"] = out["status"].astype(str)
+    out["invoice_type"] = out["invoice_type"].astype(str)
     out["count"] = out["count"].astype(int)
     out["amount"] = out["amount"].astype(float)
     return out
@@ -329,6 +374,33 @@ def render_metrics_treemap_count(df_f: pd.DataFrame, height: int = 320):
     fig.update_layout(margin=dict(l=8, r=8, t=8, b=8), height=height)
     st.plotly_chart(fig, use_container_width=True)
 
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _days_since_issue_agg(
+    tmp: pd.DataFrame, invoice_id_col: str, days_col: str, amount_col: str
+) -> pd.DataFrame:
+    """
+    Invoice count and amount per day since issue, with bar labels and the aging
+    status color. Takes only the columns it reads, so reruns with unchanged
+    filters and status selection hit the cache.
+    """
+    # One bar per day up to DAYS_CHART_CAP; older invoices share a final "N+" bar,
+    # which bounds the number of rows embedded in each chart spec.
+    days = np.minimum(tmp[days_col].to_numpy(dtype=np.int64), DAYS_CHART_CAP)
+    by_day = (
+        tmp.groupby(days, sort=True)
+        .agg(invoice_count=(invoice_id_col, "count"), amount=(amount_col, "sum"))
+        .rename_axis("days")
+        .reset_index()
+    )
+    by_day["day_label"] = by_day["days"].astype(str)
+    by_day.loc[by_day["days"] >= DAYS_CHART_CAP, "day_label"] = f"{DAYS_CHART_CAP}+"
+    # shared color rule
+    _, past_due_flag = classify_days(by_day["days"].to_numpy())
+    by_day["aging_status"] = np.where(past_due_flag, "Past Due (>0)", "Current (<=0)")
+    return by_day
+
+
 def render_invoices_by_days_since_issue_bars(
     df_f: pd.DataFrame,
     height: int = 360,
@@ -341,6 +413,7 @@ def render_invoices_by_days_since_issue_bars(
     Two bar charts (with a divider between):
       1) count of invoices by days_since_issue
       2) sum(open_amount_with_taxes when available, otherwise total_amount_with_taxes) by days_since_issue
+    Days past DAYS_CHART_CAP are grouped into a single "365+" bar.
     Color rule:
       - green if days_since_issue <= 0
       - red   if days_since_issue > 0
@@ -361,7 +434,10 @@ def render_invoices_by_days_since_issue_bars(
         key="days_since_issue_status_sel",
     )
 
-    tmp = df_f.dropna(subset=[days_col, past_due_col]).copy()
+    # days_since_issue is already Int32 and amounts float from normalize_invoices
+    tmp = df_f[[invoice_id_col, days_col, past_due_col, amount_col]].dropna(
+        subset=[days_col, past_due_col, amount_col]
+    )
     if tmp.empty:
         st.warning("No rows under current filters.")
         return
@@ -379,33 +455,14 @@ def render_invoices_by_days_since_issue_bars(
         st.warning("No rows under current filters.")
         return
 
-    tmp[days_col] = pd.to_numeric(tmp[days_col], errors="coerce")
-    tmp[amount_col] = pd.to_numeric(tmp[amount_col], errors="coerce")
-    tmp = tmp.dropna(subset=[days_col, amount_col])
-    if tmp.empty:
-        st.warning("No rows under current filters.")
-        return
-
-    tmp[days_col] = tmp[days_col].astype(int)
-
-    counts = (
-        tmp.groupby(days_col, as_index=False)
-           .agg(invoice_count=(invoice_id_col, "count"))
-           .sort_values(days_col)
-    )
-
-    amounts = (
-        tmp.groupby(days_col, as_index=False)
-           .agg(amount=(amount_col, "sum"))
-           .sort_values(days_col)
+    by_day = _days_since_issue_agg(
+        tmp[[invoice_id_col, days_col, amount_col]], invoice_id_col, days_col, amount_col
     )
+    day_order = by_day["day_label"].tolist()
 
-    # shared color rule
-    def _flag(x: int) -> str:
-        return "Current (<=0)" if x <= 0 else "Past Due (>0)"
-
-    counts["aging_status"] = counts[days_col].apply(_flag)
-    amounts["aging_status"] = amounts[days_col].apply(_flag)
+    # Each chart only embeds the columns it encodes
+    counts = by_day[["day_label", "invoice_count", "aging_status"]]
+    amounts = by_day[["day_label", "amount", "aging_status"]]
 
     color_scale = alt.Scale(
         domain=["Current (<=0)", "Past Due (>0)"],
@@ -419,11 +476,11 @@ def render_invoices_by_days_since_issue_bars(
         alt.Chart(amounts)
         .mark_bar()
         .encode(
-            x=alt.X(f"{days_col}:O", title="Days Since Issue"),
+            x=alt.X("day_label:O", sort=day_order, title="Days Since Issue"),
             y=alt.Y("amount:Q", title="Total Amount (With Taxes)"),
             color=alt.Color("aging_status:N", scale=color_scale, legend=None),
             tooltip=[
-                alt.Tooltip(f"{days_col}:O", title="Days"),
+                alt.Tooltip("day_label:O", title="Days"),
                 alt.Tooltip("amount:Q", title="Amount", format=",.2f"),
             ],
         )
@@ -440,11 +497,11 @@ def render_invoices_by_days_since_issue_bars(
         alt.Chart(counts)
         .mark_bar()
         .encode(
-            x=alt.X(f"{days_col}:O", title="Days Since Issue"),
+            x=alt.X("day_label:O", sort=day_order, title="Days Since Issue"),
             y=alt.Y("invoice_count:Q", title="Number of Invoices"),
             color=alt.Color("aging_status:N", scale=color_scale, legend=None),
             tooltip=[
-                alt.Tooltip(f"{days_col}:O", title="Days"),
+                alt.Tooltip("day_label:O", title="Days"),
                 alt.Tooltip("invoice_count:Q", title="Count"),
             ],
         )
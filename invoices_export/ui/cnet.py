@@ -0,0 +1,36 @@
+# invoices_export/ui/cnet.py
+from __future__ import annotations
+
+from typing import Callable, TypeVar
+
+import requests
+import streamlit as st
+from dotenv import load_dotenv
+
+from invoices_export.cnet_client import CNetSessionExpired, load_cnet_credentials_from_env, login
+
+T = TypeVar("T")
+
+
+@st.cache_resource(ttl="6h", show_spinner=False)
+def cnet_session() -> requests.Session:
+    """Logged-in CNET session shared by the export pipeline and the invoice ZIP download."""
+    load_dotenv()
+    return login(load_cnet_credentials_from_env(), remember_me=True)
+
+
+def with_cnet_session(fn: Callable[[requests.Session], T]) -> T:
+    """
+    Call `fn` with the cached CNET session. When the cached login has expired,
+    log in again and retry once. Any other failure also drops the cached session
+    so the next click starts from a fresh login.
+    """
+    try:
+        try:
+            return fn(cnet_session())
+        except CNetSessionExpired:
+            cnet_session.clear()
+            return fn(cnet_session())
+    except Exception:
+        cnet_session.clear()
+        raise
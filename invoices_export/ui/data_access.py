@@ -1,15 +1,41 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
 from dotenv import load_dotenv
 import pandas as pd
 from supabase import create_client
 import streamlit as st
 
+from invoices_export.ui.normalize import normalize_invoices
+
 load_dotenv()
 
 VIEW_NAME = os.getenv("SUPABASE_INVOICES_VIEW", "invoices_v")
 RAW_TABLE = os.getenv("SUPABASE_TABLE", "invoices_raw")
 URL = os.getenv("SUPABASE_URL")
 KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+FETCH_PAGE_WORKERS = 16
+
+INVOICE_VIEW_COLUMNS = (
+    "invoice_id,issue_date,creation_date,invoice_type,"
+    "buyer_company_name,vendor_company_name,payment_status,"
+    "days_since_issue,past_due,total_amount_without_taxes,"
+    "total_amount_with_taxes,gst_qc,qst_qc,hst_on,gst_ab,gst_bc,"
+    "pst_bc,hst_nb,pst_mb,gst_mb,hst_nl,gst_nt,hst_ns,gst_nu,"
+    "hst_pe,pst_sk,gst_sk,gst_yt,work_description,po_number,"
+    "building_address,fee_reference,fee_vendor_franchisee,"
+    "fee_vendor_address,fee_vendor_city,fee_vendor_postal_code,"
+    "fee_purchaser,fee_purchaser_address,fee_purchaser_city,"
+    "fee_purchaser_postal_code,fee_work_description,invoice_subtotal,"
+    "fee_gst,fee_qst,fee_hst,fee_pst,invoice_total,"
+    "franchise_fee_one_shot,franchise_fee_custodial,admin_fee,"
+    "advertising_fee,brokerage_fee,total_owed,fees_updated_at"
+)
+ENRICHMENT_COLUMNS = (
+    "invoice_id,partial_payments_amount,"
+    "partial_payments_count,open_amount_with_taxes"
+)
 
 if not URL or not KEY:
     raise RuntimeError("Missing SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY")
@@ -17,75 +43,73 @@ if not URL or not KEY:
 supabase = create_client(URL, KEY)
 
 
-@st.cache_data(ttl=300)
-def fetch_all_rows(page_size: int = 1000, max_pages: int = 5000) -> pd.DataFrame:
-    all_rows = []
-    offset = 0
-
-    for _ in range(max_pages):
-        res = (
-            supabase.table(VIEW_NAME)
-            .select(
-                "invoice_id,issue_date,creation_date,invoice_type,"
-                "buyer_company_name,vendor_company_name,payment_status,"
-                "days_since_issue,past_due,total_amount_without_taxes,"
-                "total_amount_with_taxes,gst_qc,qst_qc,hst_on,gst_ab,gst_bc,"
-                "pst_bc,hst_nb,pst_mb,gst_mb,hst_nl,gst_nt,hst_ns,gst_nu,"
-                "hst_pe,pst_sk,gst_sk,gst_yt,work_description,po_number,"
-                "building_address,fee_reference,fee_vendor_franchisee,"
-                "fee_vendor_address,fee_vendor_city,fee_vendor_postal_code,"
-                "fee_purchaser,fee_purchaser_address,fee_purchaser_city,"
-                "fee_purchaser_postal_code,fee_work_description,invoice_subtotal,"
-                "fee_gst,fee_qst,fee_hst,fee_pst,invoice_total,"
-                "franchise_fee_one_shot,franchise_fee_custodial,admin_fee,"
-                "advertising_fee,brokerage_fee,total_owed,fees_updated_at"
-            )
-            .order("invoice_id", desc=False)
-            .range(offset, offset + page_size - 1)
-            .execute()
-        )
+def _fetch_page(table: str, columns: str, offset: int, page_size: int) -> list[dict]:
+    res = (
+        supabase.table(table)
+        .select(columns)
+        .order("invoice_id", desc=False)
+        .range(offset, offset + page_size - 1)
+        .execute()
+    )
+    return res.data or []
+
+
+def _fetch_pages(table: str, columns: str, page_size: int, max_pages: int) -> list[dict]:
+    """
+    Read every row of `table` ordered by invoice_id. The row count is asked
+    for first so the page requests can run concurrently; pages are
+    concatenated in offset order.
+    """
+    total = (
+        supabase.table(table)
+        .select("invoice_id", count="exact")
+        .limit(1)
+        .execute()
+        .count
+    )
+
+    if total is None:
+        # No count available: walk the pages one after another.
+        all_rows = []
+        for page in range(max_pages):
+            rows = _fetch_page(table, columns, page * page_size, page_size)
+            all_rows.extend(rows)
+            if len(rows) < page_size:
+                break
+        return all_rows
 
-        rows = res.data or []
-        if not rows:
-            break
+    offsets = range(0, min(total, page_size * max_pages), page_size)
+    with ThreadPoolExecutor(max_workers=FETCH_PAGE_WORKERS) as executor:
+        pages = executor.map(lambda offset: _fetch_page(table, columns, offset, page_size), offsets)
+        return list(chain.from_iterable(pages))
 
-        all_rows.extend(rows)
 
-        if len(rows) < page_size:
-            break
+def _records_frame(rows: list[dict]) -> pd.DataFrame:
+    """
+    Build the frame column-by-column in Arrow when pyarrow is installed,
+    otherwise (or when a column has mixed JSON types) through pandas.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return pd.DataFrame(rows)
+
+    try:
+        return pa.Table.from_pylist(rows).to_pandas()
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pd.DataFrame(rows)
 
-        offset += page_size
 
-    df = pd.DataFrame(all_rows)
+@st.cache_data(ttl=300)
+def fetch_all_rows(page_size: int = 1000, max_pages: int = 5000) -> pd.DataFrame:
+    df = _records_frame(_fetch_pages(VIEW_NAME, INVOICE_VIEW_COLUMNS, page_size, max_pages))
     if df.empty:
         return df
 
     try:
-        enrichment_rows = []
-        offset = 0
-        for _ in range(max_pages):
-            res = (
-                supabase.table(RAW_TABLE)
-                .select(
-                    "invoice_id,partial_payments_amount,"
-                    "partial_payments_count,open_amount_with_taxes"
-                )
-                .order("invoice_id", desc=False)
-                .range(offset, offset + page_size - 1)
-                .execute()
-            )
-
-            rows = res.data or []
-            if not rows:
-                break
-
-            enrichment_rows.extend(rows)
-            if len(rows) < page_size:
-                break
-
-            offset += page_size
-
-        enrich = pd.DataFrame(enrichment_rows)
+        enrich = _records_frame(
+            _fetch_pages(RAW_TABLE, ENRICHMENT_COLUMNS, page_size, max_pages)
+        )
         if not enrich.empty:
             df = df.merge(enrich, on="invoice_id", how="left")
     except Exception:
@@ -96,32 +120,28 @@ def fetch_all_rows(page_size: int = 1000, max_pages: int = 5000) -> pd.DataFrame
     return df
 
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_normalized_invoices() -> pd.DataFrame:
+    """
+    fetch_all_rows() after normalize_invoices(), cached on its own so reruns
+    reuse the typed frame instead of re-running the dtype work on every hit.
+    """
+    df = fetch_all_rows()
+    if df.empty:
+        return df
+    return normalize_invoices(df)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
 def fetch_invoice_creation_overrides(
     page_size: int = 1000,
     max_pages: int = 5000,
 ) -> pd.DataFrame:
-    all_rows = []
-    offset = 0
-
-    for _ in range(max_pages):
-        res = (
-            supabase.table("invoice_creation_override")
-            .select("invoice_id,new_creation_date")
-            .order("invoice_id", desc=False)
-            .range(offset, offset + page_size - 1)
-            .execute()
+    return pd.DataFrame(
+        _fetch_pages(
+            "invoice_creation_override",
+            "invoice_id,new_creation_date",
+            page_size,
+            max_pages,
         )
-
-        rows = res.data or []
-        if not rows:
-            break
-
-        all_rows.extend(rows)
-
-        if len(rows) < page_size:
-            break
-
-        offset += page_size
-
-    return pd.DataFrame(all_rows)
+    )
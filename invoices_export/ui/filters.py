@@ -1,11 +1,14 @@
 # invoices_export/ui/filters.py
 from dataclasses import dataclass
 from datetime import date
-import re
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from invoices_export.ui.normalize import flag_internal_buyers
+
 
 @dataclass
 class Filters:
@@ -19,37 +22,173 @@ class Filters:
     vendor_selected: list[str]
 
 
-_COMPANY_NUM_RE = re.compile(r"^\s*(\d{4}-\d{4}|\d{7,10})\b")
+_FILTER_SOURCE_COLUMNS = [
+    "issue_date",
+    "days_since_issue",
+    "invoice_type",
+    "payment_status_norm",
+    "buyer_company_name",
+    "vendor_company_name",
+]
 
 
-def extract_company_number(name: str) -> str | None:
+@dataclass(frozen=True)
+class FilterColumns:
     """
-    Extract leading company number from strings like:
-      - "12433087 Canada Inc"
-      - "9359-6633 Quebec Inc"
-      - "2501308 Ontario Inc"
-    Returns normalized company number (e.g., "12433087", "9359-6633") or None.
+    Struct-of-arrays view of the columns the filters read, built once per
+    dataset so each rerun filters with plain numpy compares.
     """
-    if not isinstance(name, str) or not name.strip():
-        return None
-    m = _COMPANY_NUM_RE.match(name)
-    return m.group(1) if m else None
+    issue_date: np.ndarray  # datetime64[D], NaT when missing
+    days_since_issue: np.ndarray  # float64, NaN when missing
+    invoice_type: pd.Categorical
+    not_paid: np.ndarray  # bool
+    buyer: pd.Categorical
+    vendor: pd.Categorical
+    buyer_internal: np.ndarray  # bool: buyer company-number ∈ vendor company-numbers
+    dated_unpaid: np.ndarray  # bool: has issue date and age, not paid (all-pass filter result)
+    issue_range: tuple | None  # (min, max) datetime64[D] of rows with an issue date
+    aging_range: tuple | None  # (min, max) days of rows with an age
+    dataset_key: int  # content hash of the source columns, for caches keyed on this view
+
+
+@st.cache_data(show_spinner=False)
+def build_filter_columns(df: pd.DataFrame) -> FilterColumns:
+    buyer = pd.Categorical(df["buyer_company_name"])
+    if "is_internal" in df.columns:
+        buyer_internal = df["is_internal"].to_numpy(dtype=bool)
+    else:
+        buyer_internal = flag_internal_buyers(df)
+
+    issue_date = pd.to_datetime(df["issue_date"], errors="coerce").to_numpy(dtype="datetime64[D]")
+    days = pd.to_numeric(df["days_since_issue"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    not_paid = (df["payment_status_norm"] != "paid").to_numpy()
+    has_issue = ~np.isnat(issue_date)
+    has_days = ~np.isnan(days)
+
+    return FilterColumns(
+        issue_date=issue_date,
+        days_since_issue=days,
+        invoice_type=pd.Categorical(df["invoice_type"]),
+        not_paid=not_paid,
+        buyer=buyer,
+        vendor=pd.Categorical(df["vendor_company_name"]),
+        buyer_internal=buyer_internal,
+        dated_unpaid=has_issue & has_days & not_paid,
+        issue_range=(issue_date[has_issue].min(), issue_date[has_issue].max()) if has_issue.any() else None,
+        aging_range=(days[has_days].min(), days[has_days].max()) if has_days.any() else None,
+        dataset_key=int(pd.util.hash_pandas_object(df[_FILTER_SOURCE_COLUMNS], index=False).sum()),
+    )
+
+
+def _spans_all(
+    cols: FilterColumns,
+    issue_from: np.datetime64,
+    issue_to: np.datetime64,
+    aging_min: int,
+    aging_max: int,
+) -> bool:
+    """True when the date and aging bounds include every dated, aged row."""
+    if cols.issue_range is None or cols.aging_range is None:
+        return False
+    return (
+        issue_from <= cols.issue_range[0]
+        and issue_to >= cols.issue_range[1]
+        and aging_min <= cols.aging_range[0]
+        and aging_max >= cols.aging_range[1]
+    )
+
 
+def _base_mask(
+    cols: FilterColumns,
+    issue_from: date,
+    issue_to: date,
+    aging_min: int,
+    aging_max: int,
+    invoice_type: str,
+    internal_external: list[str],
+) -> np.ndarray:
+    """
+    Date, aging, invoice-type, not-paid and internal/external conditions ANDed
+    into one boolean mask, so the frame is indexed once instead of copied per
+    condition. NaT/NaN compare False, which drops rows missing a date or age.
+    """
+    issue_from = np.datetime64(issue_from, "D")
+    issue_to = np.datetime64(issue_to, "D")
+    if _spans_all(cols, issue_from, issue_to, aging_min, aging_max):
+        # Default (all-inclusive) bounds: the precomputed result, no compares.
+        mask = cols.dated_unpaid.copy()
+    else:
+        issue = cols.issue_date
+        days = cols.days_since_issue
+        mask = (
+            (issue >= issue_from)
+            & (issue <= issue_to)
+            & (days >= aging_min)
+            & (days <= aging_max)
+            & cols.not_paid
+        )
+    if invoice_type != "All":
+        mask &= cols.invoice_type == invoice_type
+
+    wanted_internal = "Internal" in internal_external
+    wanted_external = "External" in internal_external
+    if wanted_internal and not wanted_external:
+        mask &= cols.buyer_internal
+    elif wanted_external and not wanted_internal:
+        mask &= ~cols.buyer_internal
+    # else: both (or none in UI => both effective): no filter
 
-def _build_vendor_numbers_universe(df: pd.DataFrame) -> set[str]:
+    return mask
+
+
+def _present_categories(values: pd.Categorical, mask: np.ndarray) -> list[str]:
+    """Sorted categories that occur in the masked rows, found from the integer codes."""
+    codes = values.codes[mask]
+    present = np.bincount(codes[codes >= 0], minlength=len(values.categories)) > 0
+    return sorted(values.categories[present].tolist())
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _cascading_options(
+    _cols: FilterColumns,
+    dataset_key: int,
+    issue_from: date,
+    issue_to: date,
+    aging_min: int,
+    aging_max: int,
+    invoice_type: str,
+    internal_external: tuple[str, ...],
+    vendor_current: tuple[str, ...],
+    buyer_current: tuple[str, ...],
+) -> tuple[list[str], list[str]]:
     """
-    Build a set of vendor company numbers from the FULL dataset (unfiltered),
-    so future buyer names matching a vendor number are classified as Internal.
+    Buyer and vendor dropdown options for the current base filters; each side
+    is narrowed by the other side's selection. `_cols` is not hashed, the
+    cache is keyed on its dataset_key instead.
     """
-    vendor_numbers_all: set[str] = set()
-    if "vendor_company_name" not in df.columns:
-        return vendor_numbers_all
+    base_mask = _base_mask(
+        _cols, issue_from, issue_to, aging_min, aging_max, invoice_type, list(internal_external)
+    )
+
+    buyer_mask = base_mask & _cols.vendor.isin(vendor_current) if vendor_current else base_mask
+    buyers = _present_categories(_cols.buyer, buyer_mask)
 
-    for v in df["vendor_company_name"].dropna().astype(str):
-        num = extract_company_number(v)
-        if num:
-            vendor_numbers_all.add(num)
-    return vendor_numbers_all
+    vendor_mask = base_mask & _cols.buyer.isin(buyer_current) if buyer_current else base_mask
+    vendors = _present_categories(_cols.vendor, vendor_mask)
+
+    return buyers, vendors
+
+
+def filter_mask(cols: FilterColumns, f: Filters) -> np.ndarray:
+    """Boolean row mask for `f`; apply_filters materializes it as a frame."""
+    mask = _base_mask(
+        cols, f.issue_from, f.issue_to, f.aging_min, f.aging_max, f.invoice_type, f.internal_external
+    )
+    if f.buyer_selected:
+        mask &= cols.buyer.isin(f.buyer_selected)
+    if f.vendor_selected:
+        mask &= cols.vendor.isin(f.vendor_selected)
+    return mask
 
 
 def render_filters_sidebar(
@@ -58,7 +197,10 @@ def render_filters_sidebar(
     max_issue: date,
     min_aging: int,
     max_aging: int,
+    cols: FilterColumns | None = None,
 ):
+    if cols is None:
+        cols = build_filter_columns(df)
 
     # Stable state keys
     st.session_state.setdefault("issue_from", min_issue)
@@ -101,9 +243,6 @@ def render_filters_sidebar(
     if st.session_state["aging_min"] > st.session_state["aging_max"]:
         st.session_state["aging_min"], st.session_state["aging_max"] = int(min_aging), int(max_aging)
 
-    # Universe of vendor company numbers from FULL df (unfiltered)
-    vendor_numbers_all = _build_vendor_numbers_universe(df)
-
     with st.sidebar:
         st.header("Filters")
 
@@ -161,67 +300,40 @@ def render_filters_sidebar(
         )
         internal_external_effective = internal_external_ui or ["Internal", "External"]
 
-        # Build base df for dropdown options (matches apply_filters semantics)
-        df_base = df.copy()
-
-        df_base = df_base[df_base["issue_date"].notna()]
-        df_base = df_base[(df_base["issue_date"] >= issue_from) & (df_base["issue_date"] <= issue_to)]
-
-        df_base = df_base[df_base["days_since_issue"].notna()]
-        df_base = df_base[df_base["days_since_issue"] >= int(aging_min_val)]
-        df_base = df_base[df_base["days_since_issue"] <= int(aging_max_val)]
-
-        if invoice_type != "All":
-            df_base = df_base[df_base["invoice_type"] == invoice_type]
-
-        df_base = df_base[df_base["payment_status_norm"] != "paid"]
-
-        # Apply internal/external semantics to df_base using:
-        # Internal iff buyer company-number ∈ vendor_numbers_all
-        if "buyer_company_name" in df_base.columns and vendor_numbers_all:
-            buyer_nums = df_base["buyer_company_name"].astype(str).map(extract_company_number)
-            is_internal = buyer_nums.isin(vendor_numbers_all)
-        else:
-            is_internal = pd.Series(False, index=df_base.index)
-
-        wanted_internal = "Internal" in internal_external_effective
-        wanted_external = "External" in internal_external_effective
-
-        if wanted_internal and not wanted_external:
-            df_base = df_base[is_internal]
-        elif wanted_external and not wanted_internal:
-            df_base = df_base[~is_internal]
-        # else: both (or none in UI => both effective): no filter
-
         buyer_current = list(st.session_state["buyer_selected"])
         vendor_current = list(st.session_state["vendor_selected"])
 
-        # Cascading options
-        if vendor_current:
-            buyers_series = df_base.loc[df_base["vendor_company_name"].isin(vendor_current), "buyer_company_name"]
-        else:
-            buyers_series = df_base["buyer_company_name"]
-        buyers = sorted(pd.Series(buyers_series.dropna().unique()).tolist())
-
-        if buyer_current:
-            vendors_series = df_base.loc[df_base["buyer_company_name"].isin(buyer_current), "vendor_company_name"]
-        else:
-            vendors_series = df_base["vendor_company_name"]
-        vendors = sorted(pd.Series(vendors_series.dropna().unique()).tolist())
-
-        # Sanitize selections so they remain valid
-        buyer_sanitized = [b for b in buyer_current if b in buyers]
-        vendor_sanitized = [v for v in vendor_current if v in vendors]
-
-        changed = False
-        if buyer_sanitized != buyer_current:
-            st.session_state["buyer_selected"] = buyer_sanitized
-            changed = True
-        if vendor_sanitized != vendor_current:
-            st.session_state["vendor_selected"] = vendor_sanitized
-            changed = True
-        if changed:
-            st.rerun()
+        # Cascading options (match apply_filters semantics); recomputed only when
+        # the base filters or the other side's selection change.
+        # Selections that fell out of the options are dropped here, before the
+        # widgets exist, instead of via st.rerun(); dropping one side can widen
+        # the other's options, so repeat until stable (lists only shrink).
+        while True:
+            buyers, vendors = _cascading_options(
+                cols,
+                cols.dataset_key,
+                issue_from,
+                issue_to,
+                int(aging_min_val),
+                int(aging_max_val),
+                invoice_type,
+                tuple(internal_external_effective),
+                tuple(vendor_current),
+                tuple(buyer_current),
+            )
+
+            # Sanitize selections so they remain valid
+            buyers_set, vendors_set = set(buyers), set(vendors)
+            buyer_sanitized = [b for b in buyer_current if b in buyers_set]
+            vendor_sanitized = [v for v in vendor_current if v in vendors_set]
+            if buyer_sanitized == buyer_current and vendor_sanitized == vendor_current:
+                break
+            buyer_current, vendor_current = buyer_sanitized, vendor_sanitized
+
+        if buyer_current != st.session_state["buyer_selected"]:
+            st.session_state["buyer_selected"] = buyer_current
+        if vendor_current != st.session_state["vendor_selected"]:
+            st.session_state["vendor_selected"] = vendor_current
 
         buyer_selected = st.multiselect(
             "Client (Buyer) (leave empty = all)",
@@ -261,12 +373,16 @@ def render_filters_sidebar(
             key="dl_html_report",
         )
 
+        # The ZIP stays on disk; only its path is kept in session, and it is read
+        # when the download is clicked rather than on every rerun
+        reports_zip_path = st.session_state.get("reports_zip_path")
+        reports_zip_ready = bool(reports_zip_path) and Path(reports_zip_path).is_file()
         st.download_button(
             label="⬇️ Download partitioned reports (ZIP)",
-            data=st.session_state.get("reports_zip_bytes", b"") or b"",
+            data=Path(reports_zip_path).read_bytes if reports_zip_ready else b"",
             file_name=st.session_state.get("reports_zip_name", "reports_by_vendor_buyer.zip"),
             mime="application/zip",
-            disabled=not bool(st.session_state.get("reports_zip_bytes")),
+            disabled=not reports_zip_ready,
             use_container_width=True,
             key="dl_reports_zip",
         )
@@ -301,43 +417,7 @@ def render_filters_sidebar(
     return f, refresh, generate_report_full, generate_report_partitioned, generate_invoices_zip
 
 
-def apply_filters(df: pd.DataFrame, f: Filters) -> pd.DataFrame:
-    df_f = df.copy()
-
-    df_f = df_f[df_f["issue_date"].notna()]
-    df_f = df_f[(df_f["issue_date"] >= f.issue_from) & (df_f["issue_date"] <= f.issue_to)]
-
-    df_f = df_f[df_f["days_since_issue"].notna()]
-    df_f = df_f[df_f["days_since_issue"] >= f.aging_min]
-    df_f = df_f[df_f["days_since_issue"] <= f.aging_max]
-
-    if f.invoice_type != "All":
-        df_f = df_f[df_f["invoice_type"] == f.invoice_type]
-
-    if f.buyer_selected:
-        df_f = df_f[df_f["buyer_company_name"].isin(f.buyer_selected)]
-
-    if f.vendor_selected:
-        df_f = df_f[df_f["vendor_company_name"].isin(f.vendor_selected)]
-
-    df_f = df_f[df_f["payment_status_norm"] != "paid"].copy()
-
-    # Internal/external filter using buyer company-number ∈ (all vendor company-numbers)
-    vendor_numbers_all = _build_vendor_numbers_universe(df)
-
-    if "buyer_company_name" in df_f.columns and vendor_numbers_all:
-        buyer_nums = df_f["buyer_company_name"].astype(str).map(extract_company_number)
-        is_internal = buyer_nums.isin(vendor_numbers_all)
-    else:
-        is_internal = pd.Series(False, index=df_f.index)
-
-    wanted_internal = "Internal" in f.internal_external
-    wanted_external = "External" in f.internal_external
-
-    if wanted_internal and not wanted_external:
-        df_f = df_f[is_internal].copy()
-    elif wanted_external and not wanted_internal:
-        df_f = df_f[~is_internal].copy()
-    # else: both (or none in UI => both effective): no filter
-
-    return df_f
+def apply_filters(df: pd.DataFrame, f: Filters, cols: FilterColumns | None = None) -> pd.DataFrame:
+    if cols is None:
+        cols = build_filter_columns(df)
+    return df.loc[filter_mask(cols, f)]
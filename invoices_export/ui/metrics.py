@@ -1,28 +1,25 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 
 def render_metrics(df_f: pd.DataFrame):
-    current_df = df_f[~df_f["past_due"]]
-    past_due_df = df_f[df_f["past_due"]]
     amount_col = "open_amount_with_taxes" if "open_amount_with_taxes" in df_f.columns else "total_amount_with_taxes"
 
-    def sum_amt(x: pd.DataFrame) -> float:
-        return float(x[amount_col].sum()) if not x.empty else 0.0
-
-    def cnt(x: pd.DataFrame) -> int:
-        return int(len(x)) if not x.empty else 0
-
-    total_df = df_f  # already unpaid by assumption
+    # One pass: index 0 = current, 1 = past due
+    past_due = df_f["past_due"].to_numpy(dtype=bool)
+    amounts = np.nan_to_num(df_f[amount_col].to_numpy(dtype=float, na_value=np.nan))
+    counts = np.bincount(past_due, minlength=2)
+    sums = np.bincount(past_due, weights=amounts, minlength=2)
 
     # ---------- AMOUNTS ----------
     c1, c2, c3 = st.columns(3)
-    c1.metric("Current ($)", f"{sum_amt(current_df):,.2f}")
-    c2.metric("Past Due ($)", f"{sum_amt(past_due_df):,.2f}")
-    c3.metric("Total Unpaid ($)", f"{sum_amt(total_df):,.2f}")
+    c1.metric("Current ($)", f"{sums[0]:,.2f}")
+    c2.metric("Past Due ($)", f"{sums[1]:,.2f}")
+    c3.metric("Total Unpaid ($)", f"{sums.sum():,.2f}")  # already unpaid by assumption
 
     # ---------- COUNTS ----------
     k1, k2, k3 = st.columns(3)
-    k1.metric("Current (count)", f"{cnt(current_df):,}")
-    k2.metric("Past Due (count)", f"{cnt(past_due_df):,}")
-    k3.metric("Total Unpaid (count)", f"{cnt(total_df):,}")
+    k1.metric("Current (count)", f"{counts[0]:,}")
+    k2.metric("Past Due (count)", f"{counts[1]:,}")
+    k3.metric("Total Unpaid (count)", f"{counts.sum():,}")
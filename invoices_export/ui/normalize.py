@@ -1,12 +1,83 @@
 from datetime import date
+import re
+
+import numpy as np
 import pandas as pd
 
 
+CATEGORY_COLUMNS = [
+    "invoice_type",
+    "payment_status_norm",
+    "buyer_company_name",
+    "vendor_company_name",
+]
+
+
+_COMPANY_NUM_RE = re.compile(r"^\s*(\d{4}-\d{4}|\d{7,10})\b")
+
+
+def extract_company_number(name: str) -> str | None:
+    """
+    Extract leading company number from strings like:
+      - "12433087 Canada Inc"
+      - "9359-6633 Quebec Inc"
+      - "2501308 Ontario Inc"
+    Returns normalized company number (e.g., "12433087", "9359-6633") or None.
+    """
+    if not isinstance(name, str) or not name.strip():
+        return None
+    m = _COMPANY_NUM_RE.match(name)
+    return m.group(1) if m else None
+
+
+def _extract_company_numbers(names: pd.Series) -> pd.Series:
+    """Vectorized extract_company_number(); NaN where a name has no leading number."""
+    return names.str.extract(_COMPANY_NUM_RE, expand=False)
+
+
+def _build_vendor_numbers_universe(df: pd.DataFrame) -> frozenset[str]:
+    """
+    Build a set of vendor company numbers from the FULL dataset (unfiltered),
+    so future buyer names matching a vendor number are classified as Internal.
+    Each distinct vendor name is parsed once.
+    """
+    if "vendor_company_name" not in df.columns:
+        return frozenset()
+
+    # Distinct names straight from the categories; no per-row str cast
+    vendors = pd.Categorical(df["vendor_company_name"]).remove_unused_categories()
+    vendor_names = pd.Series(vendors.categories.astype(str))
+    return frozenset(_extract_company_numbers(vendor_names).dropna())
+
+
+def flag_internal_buyers(df: pd.DataFrame) -> np.ndarray:
+    """
+    Internal iff buyer company-number ∈ (all vendor company-numbers).
+    Each distinct buyer name is classified once, then broadcast through the
+    categorical codes; a missing buyer is External.
+    """
+    if "buyer_company_name" not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+
+    vendor_numbers_all = _build_vendor_numbers_universe(df)
+    buyer = pd.Categorical(df["buyer_company_name"])
+    internal_by_code = np.append(
+        _extract_company_numbers(pd.Series(buyer.categories.astype(str)))
+        .isin(vendor_numbers_all)
+        .to_numpy(),
+        False,  # code -1 (missing buyer)
+    )
+    return internal_by_code[buyer.codes]
+
+
 def normalize_invoices(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
 
-    df["issue_date"] = pd.to_datetime(df.get("issue_date"), errors="coerce").dt.date
-    df["days_since_issue"] = pd.to_numeric(df.get("days_since_issue"), errors="coerce")
+    # Kept as datetime64 so date filters compare int64 values, not date objects
+    df["issue_date"] = pd.to_datetime(df.get("issue_date"), errors="coerce")
+    # Whole days as nullable int32, so charts and filters need no per-render coercion
+    days_since_issue = pd.to_numeric(df.get("days_since_issue"), errors="coerce")
+    df["days_since_issue"] = np.trunc(days_since_issue).astype("Int32")
     df["total_amount_with_taxes"] = (
         pd.to_numeric(df.get("total_amount_with_taxes"), errors="coerce").fillna(0)
     )
@@ -48,7 +119,7 @@ def normalize_invoices(df: pd.DataFrame) -> pd.DataFrame:
         pd.to_numeric(df.get("partial_payments_amount", 0), errors="coerce").fillna(0)
     )
     df["partial_payments_count"] = (
-        pd.to_numeric(df.get("partial_payments_count", 0), errors="coerce").fillna(0).astype(int)
+        pd.to_numeric(df.get("partial_payments_count", 0), errors="coerce").fillna(0).astype("int32")
     )
     df["open_amount_with_taxes"] = (
         pd.to_numeric(df.get("open_amount_with_taxes"), errors="coerce")
@@ -72,17 +143,22 @@ def normalize_invoices(df: pd.DataFrame) -> pd.DataFrame:
     df["po_number"] = df.get("po_number", "").fillna("").astype(str)
     df["building_address"] = df.get("building_address", "").fillna("").astype(str)
 
+    # Low-cardinality keys the filters and charts group on
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype("category")
+
+    df["is_internal"] = flag_internal_buyers(df)
+
     return df
 
 
 def safe_issue_bounds(df: pd.DataFrame) -> tuple[date, date]:
-    min_issue = df["issue_date"].min()
-    max_issue = df["issue_date"].max()
+    issue_date = pd.to_datetime(df["issue_date"], errors="coerce")
+    min_issue = issue_date.min()
+    max_issue = issue_date.max()
 
-    if pd.isna(min_issue) or min_issue is None:
-        min_issue = date(2020, 1, 1)
-    if pd.isna(max_issue) or max_issue is None:
-        max_issue = date.today()
+    min_issue = date(2020, 1, 1) if pd.isna(min_issue) else min_issue.date()
+    max_issue = date.today() if pd.isna(max_issue) else max_issue.date()
 
     return min_issue, max_issue
 
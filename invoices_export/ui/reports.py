@@ -1,10 +1,11 @@
 # invoices_export/ui/reports.py
 from __future__ import annotations
 
-import io
-import zipfile
 from pathlib import Path
+import time
+import uuid
 
+import pandas as pd
 import streamlit as st
 
 from reporting.report import ClientReportGenerator
@@ -56,6 +57,11 @@ REPORT_DETAIL_COLUMNS_TO_HIDE = [
 ]
 
 
+# Each session writes its own partitioned ZIP; files older than this are removed
+REPORTS_ZIP_PREFIX = "reports_by_vendor_buyer_"
+REPORTS_ZIP_MAX_AGE_SECONDS = 24 * 3600
+
+
 def _report_hidden_columns():
     return [
         "creation_date",
@@ -65,6 +71,7 @@ def _report_hidden_columns():
         "partial_payments_amount",
         "partial_payments_count",
         "partially_paid",
+        "is_internal",
         *REPORT_DETAIL_COLUMNS_TO_HIDE,
     ]
 
@@ -75,13 +82,18 @@ def init_reports_state():
     st.session_state.setdefault("html_report_name", "accounts_receivable_report.html")
 
     # Partitioned report ZIP
-    st.session_state.setdefault("reports_zip_bytes", None)
+    st.session_state.setdefault("reports_zip_path", None)
+    st.session_state.setdefault("reports_zip_token", uuid.uuid4().hex)
     st.session_state.setdefault("reports_zip_name", "reports_by_vendor_buyer.zip")
 
 
 def _prepare_report_amount_columns(df):
     df_report = df.copy()
 
+    if "issue_date" in df_report.columns:
+        # Render as a plain date, not a midnight timestamp
+        df_report["issue_date"] = pd.to_datetime(df_report["issue_date"], errors="coerce").dt.date
+
     if "partial_payments_amount" in df_report.columns:
         df_report["partially_paid"] = df_report["partial_payments_amount"].fillna(0)
 
@@ -93,18 +105,26 @@ def _prepare_report_amount_columns(df):
     return df_report
 
 
-def _zip_folder_bytes(root_dir: Path) -> bytes:
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _render_full_report(
+    _report_generator: ClientReportGenerator,
+    template_dir: str,
+    df_report: pd.DataFrame,
+    hide_cols: tuple[str, ...],
+) -> tuple[bytes, str]:
     """
-    Zip an on-disk folder into bytes. Paths inside zip are relative to root_dir.
+    HTML bytes + file name of the full report. Keyed on the report frame's content,
+    so generating again for unchanged filters skips the groupby and template render.
     """
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as z:
-        for p in root_dir.rglob("*"):
-            if p.is_file():
-                arc = p.relative_to(root_dir).as_posix()
-                z.write(p, arcname=arc)
-    buf.seek(0)
-    return buf.read()
+    html_path = _report_generator.generate_html(
+        df=df_report,
+        client_col="buyer_company_name",
+        amount_col="total_amount_with_taxes",
+        output_name="accounts_receivable_report.html",
+        hide_columns=hide_cols,
+        template_name="report.html",
+    )
+    return html_path.read_bytes(), html_path.name
 
 
 def generate_full_html_report_to_session(df_f, report_generator: ClientReportGenerator):
@@ -113,41 +133,51 @@ def generate_full_html_report_to_session(df_f, report_generator: ClientReportGen
     df_report = _prepare_report_amount_columns(df_f)
 
     with st.spinner("Generating HTML report..."):
-        html_path = report_generator.generate_html(
-            df=df_report,
-            client_col="buyer_company_name",
-            amount_col="total_amount_with_taxes",
-            output_name="accounts_receivable_report.html",
-            hide_columns=hide_cols,
-            template_name="report.html",
+        html_bytes, html_name = _render_full_report(
+            report_generator,
+            str(report_generator.template_dir),
+            df_report,
+            tuple(hide_cols),
         )
 
-    st.session_state["html_report_bytes"] = html_path.read_bytes()
-    st.session_state["html_report_name"] = html_path.name
+    st.session_state["html_report_bytes"] = html_bytes
+    st.session_state["html_report_name"] = html_name
+
+
+def _prune_stale_report_zips(output_dir: Path) -> None:
+    """Delete partitioned ZIPs left behind by sessions that ended long ago."""
+    cutoff = time.time() - REPORTS_ZIP_MAX_AGE_SECONDS
+    for path in output_dir.glob(f"{REPORTS_ZIP_PREFIX}*.zip"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
 
 
 def generate_partitioned_reports_zip_to_session(df_f, report_generator: ClientReportGenerator):
     """
-    Generates vendor/buyer partitioned HTML files to a temp folder (inside report_generator.output_dir),
-    then zips that folder and stores bytes in session for download.
+    Renders vendor/buyer partitioned HTML files straight into a ZIP (inside
+    report_generator.output_dir) and stores its path in session for download.
+    The file is named per session, so concurrent users never share it.
     """
     hide_cols = _report_hidden_columns()
 
     df_report = _prepare_report_amount_columns(df_f)
+    token = st.session_state.setdefault("reports_zip_token", uuid.uuid4().hex)
 
     with st.spinner("Generating partitioned reports ZIP..."):
-        root_dir = report_generator.generate_html_partitioned(
+        _prune_stale_report_zips(report_generator.output_dir)
+        zip_path = report_generator.generate_html_partitioned_zip(
             df=df_report,
             client_col="buyer_company_name",
             amount_col="total_amount_with_taxes",
-            output_root_name="reports_by_vendor_buyer",
+            output_name=f"{REPORTS_ZIP_PREFIX}{token}.zip",
             report_filename="report.html",
             hide_columns=hide_cols,
             include_index_html=True,
             template_name="report_partition.html",
         )
 
-        zip_bytes = _zip_folder_bytes(root_dir)
-
-    st.session_state["reports_zip_bytes"] = zip_bytes
-    st.session_state["reports_zip_name"] = f"{root_dir.name}.zip"
+    st.session_state["reports_zip_path"] = str(zip_path)
+    st.session_state["reports_zip_name"] = "reports_by_vendor_buyer.zip"
@@ -1,5 +1,8 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
+from matplotlib import colormaps
+from matplotlib.colors import Normalize
 
 
 TAX_COLUMNS = [
@@ -23,6 +26,33 @@ TAX_COLUMNS = [
 ]
 
 
+# Above this many rows the table skips Styler (per-cell CSS on the server)
+# and lets the grid format cells client-side via column_config.
+STYLED_TABLE_MAX_ROWS = 500
+
+_HEX_BYTES = np.array([f"{i:02x}" for i in range(256)])
+
+
+def _gradient_css(values: pd.Series, cmap: str, vmin=None, vmax=None) -> np.ndarray:
+    """
+    Same CSS as Styler.background_gradient, built as one array op over the column
+    instead of a Python call per cell.
+    """
+    x = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    vmin = np.nanmin(x) if vmin is None else vmin
+    vmax = np.nanmax(x) if vmax is None else vmax
+    rgb = colormaps[cmap](Normalize(vmin, vmax)(x))[:, :3]
+
+    # W3C relative luminance, dark backgrounds get light text
+    lin = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    dark = lin @ np.array([0.2126, 0.7152, 0.0722]) < 0.408
+
+    hex_parts = _HEX_BYTES[np.round(rgb * 255).astype(np.intp)]
+    hex_color = hex_parts[:, 0] + hex_parts[:, 1] + hex_parts[:, 2]
+    text_color = np.where(dark, "#f1f1f1", "#000000")
+    return "background-color: #" + hex_color + ";color: " + text_color + ";"
+
+
 def render_past_due_table(table_df: pd.DataFrame):
     st.divider()
     st.subheader("Unpaid Table")
@@ -60,15 +90,13 @@ def render_past_due_table(table_df: pd.DataFrame):
             {True: "Past Due", False: "Current"}
         )
 
-    def color_past_due(val):
-        if pd.isna(val):
-            return ""
-        if val == "Past Due":
-            return "background-color: #c62828; color: white;"
-        else:  # "No"
-            return "background-color: #2e7d32; color: white;"
+    def color_past_due(col):
+        return np.select(
+            [col.isna(), col.eq("Past Due")],
+            ["", "background-color: #c62828; color: white;"],
+            default="background-color: #2e7d32; color: white;",  # "Current"
+        )
 
-    style = table_df.style
     money_cols = [
         c
         for c in [
@@ -79,17 +107,36 @@ def render_past_due_table(table_df: pd.DataFrame):
         ]
         if c in table_df.columns
     ]
+
+    if len(table_df) > STYLED_TABLE_MAX_ROWS:
+        column_config = {c: st.column_config.NumberColumn(format="accounting") for c in money_cols}
+        if "issue_date" in table_df.columns:
+            column_config["issue_date"] = st.column_config.DateColumn(format="YYYY-MM-DD")
+        if "days_since_issue" in table_df.columns:
+            days = pd.to_numeric(table_df["days_since_issue"], errors="coerce")
+            if days.notna().any():
+                column_config["days_since_issue"] = st.column_config.ProgressColumn(
+                    format="%d",
+                    min_value=min(int(days.min()), 0),
+                    max_value=max(int(days.max()), 1),
+                )
+        st.dataframe(
+            table_df,
+            column_config=column_config,
+            use_container_width=True,
+            height=650,
+            hide_index=True,
+        )
+        return
+
+    style = table_df.style
     if money_cols:
         style = style.format({c: "{:,.2f}" for c in money_cols})
-
-    def apply_cell_style(styler, func, subset):
-        # pandas newer versions use Styler.map; older ones still expose applymap.
-        if hasattr(styler, "map"):
-            return styler.map(func, subset=subset)
-        return styler.applymap(func, subset=subset)
+    if "issue_date" in table_df.columns and pd.api.types.is_datetime64_any_dtype(table_df["issue_date"]):
+        style = style.format({"issue_date": "{:%Y-%m-%d}"}, na_rep="")
 
     if "past_due" in table_df.columns:
-        style = apply_cell_style(style, color_past_due, subset=["past_due"])
+        style = style.apply(color_past_due, subset=["past_due"])
 
     if "days_since_issue" in table_df.columns:
         col = "days_since_issue"
@@ -98,7 +145,8 @@ def render_past_due_table(table_df: pd.DataFrame):
         if s.notna().any():
             max_abs = max(abs(s.min()), abs(s.max()))
 
-            style = style.background_gradient(
+            style = style.apply(
+                _gradient_css,
                 subset=[col],
                 cmap="RdBu_r",   # Blue (neg) → White (0) → Red (pos)
                 vmin=-max_abs,
@@ -107,6 +155,6 @@ def render_past_due_table(table_df: pd.DataFrame):
 
 
     if "total_amount_with_taxes" in table_df.columns:
-        style = style.background_gradient(subset=["total_amount_with_taxes"], cmap="Greens")
+        style = style.apply(_gradient_css, subset=["total_amount_with_taxes"], cmap="Greens")
 
     st.dataframe(style, use_container_width=True, height=650, hide_index=True)
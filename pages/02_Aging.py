@@ -6,9 +6,10 @@ import streamlit as st
 from downloads.cnet_invoice_zip import build_past_due_invoices_zip_by_vendor_buyer
 from reporting.report import ClientReportGenerator
 
-from invoices_export.ui.data_access import fetch_all_rows
-from invoices_export.ui.normalize import normalize_invoices, safe_issue_bounds, safe_aging_bounds
-from invoices_export.ui.filters import render_filters_sidebar, apply_filters
+from invoices_export.ui.cnet import with_cnet_session
+from invoices_export.ui.data_access import fetch_normalized_invoices
+from invoices_export.ui.normalize import safe_issue_bounds, safe_aging_bounds
+from invoices_export.ui.filters import apply_filters, build_filter_columns, render_filters_sidebar
 from invoices_export.ui.reports import (
     init_reports_state,
     generate_full_html_report_to_session,
@@ -26,36 +27,43 @@ st.title("Aging")
 REPORT_OUTPUT_DIR = Path("reports")
 REPORT_OUTPUT_DIR.mkdir(exist_ok=True)
 
-report_generator = ClientReportGenerator(
-    template_dir="reporting/templates",
-    output_dir=str(REPORT_OUTPUT_DIR),
-)
+
+@st.cache_resource(show_spinner=False)
+def _report_generator() -> ClientReportGenerator:
+    # Shared across reruns so its compiled templates are kept
+    return ClientReportGenerator(
+        template_dir="reporting/templates",
+        output_dir=str(REPORT_OUTPUT_DIR),
+    )
+
+
+report_generator = _report_generator()
 
 init_reports_state()
 
-# Load
-df = fetch_all_rows()
+# Load (fetched and normalized, cached as one typed frame)
+df = fetch_normalized_invoices()
 if df.empty:
     st.info("No rows found.")
     st.stop()
 
-# Normalize
-df = normalize_invoices(df)
-
 # Bounds
 min_issue, max_issue = safe_issue_bounds(df)
 min_aging, max_aging = safe_aging_bounds(df)
 
+# Filter columns as plain arrays, shared by the sidebar options and apply_filters
+filter_cols = build_filter_columns(df)
+
 # Sidebar
 f, refresh, gen_full, gen_partitioned, gen_invoices_zip = render_filters_sidebar(
-    df, min_issue, max_issue, min_aging, max_aging
+    df, min_issue, max_issue, min_aging, max_aging, cols=filter_cols
 )
 
 if refresh:
     st.cache_data.clear()
 
 # Apply filters
-df_f = apply_filters(df, f)
+df_f = apply_filters(df, f, cols=filter_cols)
 if df_f.empty:
     st.info("No rows found with current filters (after removing Paid).")
     st.stop()
@@ -70,12 +78,19 @@ if gen_partitioned:
     st.rerun()
 
 if gen_invoices_zip:
-    # df_f is not paid; ZIP wants only past due PDFs
-    df_zip = df_f[df_f["past_due"]].copy()
-    zip_bytes, zip_name = build_past_due_invoices_zip_by_vendor_buyer(df_zip)
-    st.session_state["invoices_zip_bytes"] = zip_bytes
-    st.session_state["invoices_zip_name"] = zip_name
-    st.rerun()
+    # df_f is not paid; ZIP wants only past due PDFs. The builder only reads
+    # columns, so no copy; the ndarray mask skips index alignment.
+    df_zip = df_f.loc[df_f["past_due"].to_numpy(dtype=bool)]
+    try:
+        zip_bytes, zip_name = with_cnet_session(
+            lambda session: build_past_due_invoices_zip_by_vendor_buyer(df_zip, session=session)
+        )
+    except Exception as e:
+        st.error(f"Invoices ZIP failed: {e}")
+    else:
+        st.session_state["invoices_zip_bytes"] = zip_bytes
+        st.session_state["invoices_zip_name"] = zip_name
+        st.rerun()
 
 tab_list = ["By Days", "By Vendor", "By Buyer"]
 
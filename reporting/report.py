@@ -1,11 +1,24 @@
 # reporting/report.py
 from __future__ import annotations
 
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
-from typing import Iterable, Optional
+import tempfile
+import zipfile
+from typing import Iterable, Iterator, Optional
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, Template
+import numpy as np
+import pandas as pd
+
+
+RENDER_WORKERS = 8
+RENDER_WINDOW = 2 * RENDER_WORKERS  # rendered pages held before they are written
+
+_PATH_PART_BAD_RE = re.compile(r"[^\w\-. ]+", flags=re.UNICODE)
+_PATH_PART_WS_RE = re.compile(r"\s+")
 
 
 def sanitize_path_part(s: str, maxlen: int = 80) -> str:
@@ -13,12 +26,45 @@ def sanitize_path_part(s: str, maxlen: int = 80) -> str:
     Make a safe folder/file name fragment.
     """
     s = (s or "").strip()
-    s = re.sub(r"[^\w\-. ]+", "_", s, flags=re.UNICODE)
-    s = re.sub(r"\s+", "_", s)
+    s = _PATH_PART_BAD_RE.sub("_", s)
+    s = _PATH_PART_WS_RE.sub("_", s)
     s = s.strip("._-")
     return (s[:maxlen] or "(null)")
 
 
+def _column_values(s: pd.Series) -> list:
+    if getattr(s.dtype, "na_value", None) is pd.NA:
+        # Templates test `is not none`; nullable dtypes would give pd.NA
+        return s.to_numpy(dtype=object, na_value=None).tolist()
+    return s.tolist()
+
+
+def _grouped_rows(groups, columns: list) -> Iterator[list[tuple]]:
+    """
+    Rows of each group of a DataFrameGroupBy, in group order, as namedtuples over
+    `columns` (templates read fields by attribute, or by position against the same
+    column list). Rows are ordered by group once and every column becomes one
+    Python list, so each group is a set of list slices instead of a sub-DataFrame.
+    """
+    # rename: names that are not identifiers become _<pos>; templates label cells from `columns`
+    row_type = namedtuple("Row", columns, rename=True)
+    ids = groups.ngroup().to_numpy(dtype=float, na_value=np.nan)  # NaN for dropped keys
+    order = np.argsort(ids, kind="stable")  # stable: rows keep frame order within a group
+    order = order[~np.isnan(ids[order])]
+    bounds = np.searchsorted(ids[order], np.arange(groups.ngroups + 1))
+
+    by_group = groups.obj[columns].take(order)
+    values = [_column_values(by_group.iloc[:, i]) for i in range(len(columns))]
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        yield list(map(row_type._make, zip(*(v[start:stop] for v in values))))
+
+
+def _render_columns(df: pd.DataFrame, hide_columns: set, vendor_col: str, buyer_col: str) -> list:
+    """Columns shown in report rows: everything but hidden and grouping columns, in frame order."""
+    dropped = {*hide_columns, vendor_col, buyer_col}
+    return [c for c in df.columns if c not in dropped]
+
+
 class ClientReportGenerator:
     """
     Generates HTML reports using Jinja2 templates.
@@ -36,7 +82,16 @@ class ClientReportGenerator:
         self.env = Environment(
             loader=FileSystemLoader(self.template_dir),
             autoescape=True,
+            auto_reload=False,  # templates ship with the app; skip the per-lookup stat
         )
+        self._tpl_cache: dict[str, Template] = {}
+
+    def _tpl(self, name: str) -> Template:
+        """Compiled template by name, looked up in the Environment once per generator."""
+        template = self._tpl_cache.get(name)
+        if template is None:
+            template = self._tpl_cache[name] = self.env.get_template(name)
+        return template
 
     def generate_html(
         self,
@@ -51,6 +106,7 @@ class ClientReportGenerator:
         """
         Full report (single HTML file) with structure:
           vendors: [{vendor, vendor_total, buyers:[{buyer, rows, subtotal}]}]
+          columns (names of the row fields, in order)
           grand_total
         """
         hide_columns = set(hide_columns or [])
@@ -58,47 +114,98 @@ class ClientReportGenerator:
         vendor_col = "vendor_company_name"
         buyer_col = client_col
 
-        vendors = []
-        for vendor, df_vendor in df.groupby(vendor_col):
-            buyers = []
-            vendor_total = float(df_vendor[amount_col].sum())
-
-            for buyer, df_buyer in df_vendor.groupby(buyer_col):
-                g_render = df_buyer.drop(
-                    columns=[
-                        c for c in (*hide_columns, vendor_col, buyer_col)
-                        if c in df_buyer.columns
-                    ],
-                    errors="ignore",
-                )
+        # One (vendor, buyer) groupby: subtotals in a single aggregate, and the
+        # sorted group order walks vendors contiguously
+        groups = df.groupby([vendor_col, buyer_col], observed=True)
+        subtotals = groups[amount_col].sum()
+        vendor_totals = subtotals.groupby(level=0, observed=True).sum()
+        render_cols = _render_columns(df, hide_columns, vendor_col, buyer_col)
 
-                buyers.append(
+        vendors = []
+        for (vendor, buyer), rows in zip(subtotals.index, _grouped_rows(groups, render_cols)):
+            if not vendors or vendors[-1]["vendor"] != vendor:
+                vendors.append(
                     {
-                        "buyer": buyer,
-                        "rows": g_render.to_dict(orient="records"),
-                        "subtotal": float(df_buyer[amount_col].sum()),
+                        "vendor": vendor,
+                        "buyers": [],
+                        "vendor_total": float(vendor_totals[vendor]),
                     }
                 )
 
-            vendors.append(
+            vendors[-1]["buyers"].append(
                 {
-                    "vendor": vendor,
-                    "buyers": buyers,
-                    "vendor_total": vendor_total,
+                    "buyer": buyer,
+                    "rows": rows,
+                    "subtotal": float(subtotals[(vendor, buyer)]),
                 }
             )
 
         context = {
             "vendors": vendors,
+            "columns": render_cols,
             "grand_total": float(df[amount_col].sum()),
         }
 
-        html = self.env.get_template(template_name).render(**context)
+        html = self._tpl(template_name).render(**context)
 
         output_path = self.output_dir / output_name
         output_path.write_text(html, encoding="utf-8")
         return output_path
 
+    def _partitions(self, df, client_col, amount_col, hide_columns, report_filename):
+        """
+        Yields (relative report path, render context, index entry) per (vendor, buyer),
+        vendors contiguous. Relative paths are Vendor/Buyer/<report_filename>.
+        """
+        hide_columns = set(hide_columns or [])
+
+        vendor_col = "vendor_company_name"
+        buyer_col = client_col
+
+        grand_total = float(df[amount_col].sum())
+
+        # Same single (vendor, buyer) groupby as generate_html
+        groups = df.groupby([vendor_col, buyer_col], observed=True)
+        subtotals = groups[amount_col].sum()
+        vendor_totals = subtotals.groupby(level=0, observed=True).sum()
+        render_cols = _render_columns(df, hide_columns, vendor_col, buyer_col)
+
+        # Buyers repeat under many vendors; sanitize each distinct name once
+        sanitized: dict[str, str] = {}
+
+        def path_part(name) -> str:
+            name = str(name)
+            part = sanitized.get(name)
+            if part is None:
+                part = sanitized[name] = sanitize_path_part(name, maxlen=80)
+            return part
+
+        for (vendor, buyer), rows in zip(subtotals.index, _grouped_rows(groups, render_cols)):
+            buyer_total = float(subtotals[(vendor, buyer)])
+            rel = f"{path_part(vendor)}/{path_part(buyer)}/{report_filename}"
+
+            context = {
+                "vendor": vendor,
+                "buyer": buyer,
+                "rows": rows,
+                "columns": render_cols,
+                "buyer_total": buyer_total,
+                # keep in context in case you want them later, but template no longer shows them
+                "vendor_total": float(vendor_totals[vendor]),
+                "grand_total": grand_total,
+            }
+            entry = {
+                "vendor": vendor,
+                "buyer": buyer,
+                "buyer_total": buyer_total,
+                "href": rel,
+            }
+            yield rel, context, entry
+
+    def _render_index(self, index_entries: list) -> str:
+        # Autoescaped, so vendor/buyer names cannot break the page markup
+        return self._tpl("report_index.html").render(entries=index_entries)
+
     def generate_html_partitioned(
         self,
         df,
@@ -127,90 +234,107 @@ class ClientReportGenerator:
 
         Returns: root directory path for the generated tree.
 
-        NOTE: This writes to disk. For Streamlit Cloud, you can still write to /tmp
-        and then ZIP it for download.
+        NOTE: This writes to disk. To download the tree as one file, use
+        generate_html_partitioned_zip() instead of zipping this folder.
         """
-        hide_columns = set(hide_columns or [])
-
-        vendor_col = "vendor_company_name"
-        buyer_col = client_col
-
         root_dir = self.output_dir / output_root_name
         root_dir.mkdir(parents=True, exist_ok=True)
 
-        grand_total = float(df[amount_col].sum())
         index_entries = []
 
-        for vendor, df_vendor in df.groupby(vendor_col):
-            vendor_total = float(df_vendor[amount_col].sum())
-            vendor_dir = root_dir / sanitize_path_part(str(vendor), maxlen=80)
-            vendor_dir.mkdir(parents=True, exist_ok=True)
-
-            for buyer, df_buyer in df_vendor.groupby(buyer_col):
-                buyer_total = float(df_buyer[amount_col].sum())
-                buyer_dir = vendor_dir / sanitize_path_part(str(buyer), maxlen=80)
-                buyer_dir.mkdir(parents=True, exist_ok=True)
-
-                g_render = df_buyer.drop(
-                    columns=[
-                        c for c in (*hide_columns, vendor_col, buyer_col)
-                        if c in df_buyer.columns
-                    ],
-                    errors="ignore",
-                )
+        # Parsed once and shared; each render gets its own context, so workers can reuse it
+        template = self._tpl(template_name)
+
+        def render_to(out_path: Path, context: dict) -> None:
+            out_path.write_text(template.render(**context), encoding="utf-8")
+
+        # Renders and writes overlap with building the next groups. At most
+        # RENDER_WINDOW contexts are in flight; the oldest is awaited before more
+        # groups are built, so its first failure is raised.
+        with ThreadPoolExecutor(max_workers=RENDER_WORKERS) as executor:
+            pending = deque()
+            seen_dirs: set[Path] = set()
+            for rel, context, entry in self._partitions(
+                df, client_col, amount_col, hide_columns, report_filename
+            ):
+                out_path = root_dir / rel
+                if out_path.parent not in seen_dirs:
+                    out_path.parent.mkdir(parents=True, exist_ok=True)
+                    seen_dirs.add(out_path.parent)
+                # Names that sanitize alike share a path; finish the earlier write so the last one wins
+                for path, future in pending:
+                    if path == out_path:
+                        future.result()
+                pending.append((out_path, executor.submit(render_to, out_path, context)))
+                if len(pending) >= RENDER_WINDOW:
+                    pending.popleft()[1].result()
 
-                context = {
-                    "vendor": vendor,
-                    "buyer": buyer,
-                    "rows": g_render.to_dict(orient="records"),
-                    "buyer_total": buyer_total,
-                    # keep in context in case you want them later, but template no longer shows them
-                    "vendor_total": vendor_total,
-                    "grand_total": grand_total,
-                }
+                if include_index_html:
+                    index_entries.append(entry)
 
-                html = self.env.get_template(template_name).render(**context)
+            while pending:
+                pending.popleft()[1].result()
 
-                out_path = buyer_dir / report_filename
-                out_path.write_text(html, encoding="utf-8")
+        if include_index_html:
+            (root_dir / "index.html").write_text(self._render_index(index_entries), encoding="utf-8")
 
-                if include_index_html:
-                    rel = out_path.relative_to(root_dir).as_posix()
-                    index_entries.append(
-                        {
-                            "vendor": vendor,
-                            "buyer": buyer,
-                            "buyer_total": buyer_total,
-                            "href": rel,
-                        }
-                    )
+        return root_dir
 
-        if include_index_html:
-            lines = [
-                "<!doctype html>",
-                "<html><head><meta charset='utf-8'>",
-                "<title>Reports</title>",
-                "<style>body{font-family:system-ui,Segoe UI,Roboto,Arial,sans-serif;max-width:1100px;margin:24px auto;padding:0 16px}"
-                "table{border-collapse:collapse;width:100%}"
-                "th,td{border:1px solid #ddd;padding:8px}"
-                "th{text-align:left;background:#f6f6f6}"
-                "</style></head><body>",
-                "<h1>Reports by Vendor / Buyer</h1>",
-                "<table>",
-                "<thead><tr><th>Vendor</th><th>Buyer</th><th>Buyer total</th><th>Link</th></tr></thead>",
-                "<tbody>",
-            ]
-            for e in index_entries:
-                lines.append(
-                    "<tr>"
-                    f"<td>{e['vendor']}</td>"
-                    f"<td>{e['buyer']}</td>"
-                    f"<td>{e['buyer_total']:.2f}</td>"
-                    f"<td><a href='{e['href']}'>report</a></td>"
-                    "</tr>"
-                )
-            lines += ["</tbody></table>", "</body></html>"]
+    def generate_html_partitioned_zip(
+        self,
+        df,
+        client_col,  # buyer column from dashboard
+        amount_col,
+        *,
+        output_name: str = "reports_by_vendor_buyer.zip",
+        report_filename: str = "report.html",
+        hide_columns: Optional[Iterable[str]] = None,
+        include_index_html: bool = True,
+        template_name: str = "report_partition.html",
+    ) -> Path:
+        """
+        Same Vendor/Buyer/report.html layout as generate_html_partitioned(), but each
+        rendered page goes straight into output/<output_name> as a ZIP entry: no
+        folder tree on disk and no second pass re-reading it to zip.
 
-            (root_dir / "index.html").write_text("\n".join(lines), encoding="utf-8")
+        Returns: path of the ZIP file.
+        """
+        template = self._tpl(template_name)
 
-        return root_dir
+        zip_path = self.output_dir / output_name
+        parts = list(self._partitions(df, client_col, amount_col, hide_columns, report_filename))
+        # Names that sanitize alike share a path; the last one wins, as on disk
+        last = {rel: i for i, (rel, _, _) in enumerate(parts)}
+
+        # Unique temp name: concurrent generations never write the same file
+        tmp = tempfile.NamedTemporaryFile(
+            dir=zip_path.parent, prefix=f"{zip_path.stem}.", suffix=".tmp", delete=False
+        )
+        tmp_path = Path(tmp.name)
+        try:
+            # Workers render; ZipFile is not thread-safe, so entries are written here in
+            # order, each as soon as it is ready. At most RENDER_WINDOW pages are held.
+            # Deflate level 1: the HTML still shrinks ~4x, at about half the CPU of the default.
+            with tmp, ThreadPoolExecutor(max_workers=RENDER_WORKERS) as executor, zipfile.ZipFile(
+                tmp, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1
+            ) as zf:
+                pending = deque()
+                for i, (rel, context, _) in enumerate(parts):
+                    if last[rel] != i:
+                        continue
+                    pending.append((rel, executor.submit(template.render, **context)))
+                    if len(pending) >= RENDER_WINDOW:
+                        rel_done, future = pending.popleft()
+                        zf.writestr(rel_done, future.result())
+                while pending:
+                    rel_done, future = pending.popleft()
+                    zf.writestr(rel_done, future.result())
+
+                if include_index_html:
+                    zf.writestr("index.html", self._render_index([entry for _, _, entry in parts]))
+
+            tmp_path.replace(zip_path)  # a download never sees a half-written file
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return zip_path
@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from invoices_export.ui.charts import (
+    DAYS_CHART_CAP,
+    _days_since_issue_agg,
+    _metrics_rollup,
+    _past_due_bins_agg,
+    _split_by_group_agg,
+    classify_days,
+)
+
+
+class PastDueBinsTests(unittest.TestCase):
+    def test_classify_days_bins_and_flags(self):
+        bin_idx, past_due_flag = classify_days(np.array([-5, 0, 1, 29, 30, 61]))
+
+        self.assertEqual(bin_idx.tolist(), [-1, 0, 0, 0, 1, 2])
+        self.assertEqual(past_due_flag.tolist(), [0, 0, 1, 1, 1, 1])
+
+    def test_bins_count_and_sum_by_30_day_window(self):
+        by_bin, max_edge = _past_due_bins_agg(
+            np.array([0.0, 29.0, 30.0, 95.0, -3.0]),
+            np.array([10.0, np.nan, 5.5, 2.0, 100.0]),
+        )
+
+        self.assertEqual(max_edge, 120)
+        self.assertEqual(by_bin["aging_bin"].tolist(), ["0-29", "30-59", "90-119"])
+        self.assertEqual(by_bin["bin_start"].tolist(), [0, 30, 90])
+        self.assertEqual(by_bin["count"].tolist(), [2, 1, 1])
+        self.assertEqual(by_bin["amount"].tolist(), [10.0, 5.5, 2.0])
+
+
+class ChartAggregationTests(unittest.TestCase):
+    def test_days_since_issue_caps_old_invoices_into_one_bar(self):
+        tmp = pd.DataFrame(
+            {
+                "invoice_id": [1, 2, 3, 4],
+                "days_since_issue": pd.array([-2, 5, DAYS_CHART_CAP, DAYS_CHART_CAP + 40], dtype="Int32"),
+                "open_amount_with_taxes": [1.0, 2.0, 3.0, 4.0],
+            }
+        )
+
+        by_day = _days_since_issue_agg(tmp, "invoice_id", "days_since_issue", "open_amount_with_taxes")
+
+        self.assertEqual(by_day["day_label"].tolist(), ["-2", "5", f"{DAYS_CHART_CAP}+"])
+        self.assertEqual(by_day["invoice_count"].tolist(), [1, 1, 2])
+        self.assertEqual(by_day["amount"].tolist(), [1.0, 2.0, 7.0])
+        self.assertEqual(
+            by_day["aging_status"].tolist(), ["Current (<=0)", "Past Due (>0)", "Past Due (>0)"]
+        )
+
+    def test_split_keeps_top_groups_with_status_shares(self):
+        tmp = pd.DataFrame(
+            {
+                "vendor_company_name": ["A", "A", "B", "C"],
+                "past_due": [True, False, True, False],
+                "open_amount_with_taxes": [3.0, 1.0, 10.0, 0.5],
+            }
+        )
+
+        g, totals = _split_by_group_agg(
+            tmp, "vendor_company_name", "past_due", "open_amount_with_taxes", 2
+        )
+
+        self.assertEqual(totals["group"].tolist(), ["B", "A"])
+        self.assertEqual(totals["total"].tolist(), [10.0, 4.0])
+        shares = {(row.group, row.status): row.pct for row in g.itertuples()}
+        self.assertEqual(
+            shares,
+            {("A", "Past Due"): 0.75, ("A", "Not Past Due"): 0.25, ("B", "Past Due"): 1.0},
+        )
+
+
+class MetricsRollupTests(unittest.TestCase):
+    def test_rollup_always_has_the_four_status_type_combos(self):
+        df = pd.DataFrame(
+            {
+                "past_due": [True, False, True, None],
+                "invoice_type": ["Regular", "Regular", "Other", "One Shot"],
+                "open_amount_with_taxes": [1.5, 2.0, 3.0, 4.0],
+            }
+        )
+
+        out = _metrics_rollup(df)
+
+        self.assertEqual(
+            out[["status", "invoice_type"]].values.tolist(),
+            [
+                ["Current", "Regular"],
+                ["Current", "One Shot"],
+                ["Past Due", "Regular"],
+                ["Past Due", "One Shot"],
+            ],
+        )
+        self.assertEqual(out["amount"].tolist(), [2.0, 0.0, 1.5, 0.0])
+        self.assertEqual(out["count"].tolist(), [1, 0, 1, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
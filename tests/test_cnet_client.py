@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from invoices_export.cnet_client import CNetCredentials, CNetSessionExpired, login, parse_html
+from invoices_export.ui.cnet import with_cnet_session
+
+LOGIN_FORM = """
+<form action="/login_check" method="post">
+  <input type="hidden" name="_csrf_token" value="token">
+  <input type="text" name="_username">
+  <input type="password" name="_password">
+  <input type="submit" name="_submit" value="Log in">
+</form>
+"""
+
+
+class FakeResponse:
+    def __init__(self, text="", url=""):
+        self.text = text
+        self.url = url
+
+    def raise_for_status(self):
+        pass
+
+
+class LoginFormSession:
+    def __init__(self, landing_url):
+        self.headers = {}
+        self.landing_url = landing_url
+        self.posted = None
+
+    def mount(self, *_args, **_kwargs):
+        pass
+
+    def get(self, url, **_kwargs):
+        return FakeResponse(text=LOGIN_FORM, url=url)
+
+    def post(self, url, data=None, **_kwargs):
+        self.posted = (url, data)
+        return FakeResponse(url=self.landing_url)
+
+
+class LoginTests(unittest.TestCase):
+    def test_login_posts_the_form_with_credentials(self):
+        session = LoginFormSession("https://app.master.cnetfranchise.com/manager/")
+        with patch("invoices_export.cnet_client.requests.Session", return_value=session):
+            self.assertIs(login(CNetCredentials(user="user", password="secret")), session)
+
+        url, data = session.posted
+        self.assertEqual(url, "https://app.master.cnetfranchise.com/login_check")
+        self.assertEqual(
+            data,
+            {
+                "_csrf_token": "token",
+                "_submit": "Log in",
+                "_username": "user",
+                "_password": "secret",
+                "_remember_me": "on",
+            },
+        )
+
+    def test_login_redirected_back_to_login_fails(self):
+        session = LoginFormSession("https://app.master.cnetfranchise.com/login")
+        with patch("invoices_export.cnet_client.requests.Session", return_value=session):
+            with self.assertRaisesRegex(RuntimeError, "Login appears to have failed"):
+                login(CNetCredentials(user="user", password="wrong"))
+
+    def test_parse_html_returns_none_for_empty_documents(self):
+        self.assertIsNone(parse_html(""))
+        self.assertIsNone(parse_html("   "))
+        self.assertEqual(parse_html("<p>Hi</p>").xpath("string(//p)"), "Hi")
+
+
+class CachedSessionTests(unittest.TestCase):
+    def test_expired_session_is_rebuilt_and_retried_once(self):
+        stale, fresh = object(), object()
+        cached = MagicMock(side_effect=[stale, fresh])
+
+        def fetch(session):
+            if session is stale:
+                raise CNetSessionExpired("expired")
+            return "data"
+
+        with patch("invoices_export.ui.cnet.cnet_session", cached):
+            self.assertEqual(with_cnet_session(fetch), "data")
+        cached.clear.assert_called_once_with()
+
+    def test_other_failures_drop_the_cached_session_without_retrying(self):
+        cached = MagicMock(return_value=object())
+        fetch = MagicMock(side_effect=ValueError("boom"))
+
+        with patch("invoices_export.ui.cnet.cnet_session", cached):
+            with self.assertRaisesRegex(ValueError, "boom"):
+                with_cnet_session(fetch)
+        fetch.assert_called_once()
+        cached.clear.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,44 @@
 from decimal import Decimal
 import unittest
+from unittest.mock import patch
 
+from invoices_export.cnet_client import CNetSessionExpired
 from invoices_export.exporter import (
     _extract_payment_summary,
     _extract_po_number,
     _parse_money,
     _pick_export_url,
+    get_csv_exports_bytes,
+    get_purchase_order_numbers,
 )
 
+EXPIRED_URL = "https://app.master.cnetfranchise.com/login"
+
+
+class FakeResponse:
+    def __init__(self, url, text=""):
+        self.url = url
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+class ExpiredSession:
+    """A session whose cookie went stale: every page redirects to /login."""
+
+    def __init__(self):
+        self.headers = {}
+        self.cookies = {}
+        self.requested = []
+
+    def mount(self, *_args, **_kwargs):
+        pass
+
+    def get(self, url, **_kwargs):
+        self.requested.append(url)
+        return FakeResponse(EXPIRED_URL, "<form action='/login_check'></form>")
+
 
 class ExporterParsingTests(unittest.TestCase):
     def test_pick_export_url_prefers_named_export_link(self):
@@ -62,5 +93,22 @@ class ExporterParsingTests(unittest.TestCase):
         self.assertIsNone(_extract_po_number("<p>Invoice Number: 123</p>"))
 
 
+class SessionExpiryTests(unittest.TestCase):
+    def test_export_raises_session_expired_on_login_redirect(self):
+        session = ExpiredSession()
+
+        with self.assertRaises(CNetSessionExpired):
+            get_csv_exports_bytes(session)
+        self.assertEqual(len(session.requested), 1)
+
+    def test_purchase_orders_raise_session_expired_instead_of_counting_failures(self):
+        authenticated = ExpiredSession()
+        authenticated.cookies = type("Jar", (), {"get_dict": lambda _self: {}})()
+
+        with patch("invoices_export.exporter.requests.Session", ExpiredSession):
+            with self.assertRaises(CNetSessionExpired):
+                get_purchase_order_numbers([str(i) for i in range(50)], session=authenticated)
+
+
 if __name__ == "__main__":
     unittest.main()
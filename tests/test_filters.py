@@ -0,0 +1,117 @@
+from datetime import date
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from invoices_export.ui.filters import (
+    Filters,
+    _cascading_options,
+    apply_filters,
+    build_filter_columns,
+)
+
+
+def filter_frame():
+    return pd.DataFrame(
+        {
+            "invoice_id": [1, 2, 3, 4, 5, 6],
+            "issue_date": [
+                date(2026, 3, 1),
+                date(2026, 3, 2),
+                None,
+                date(2026, 3, 3),
+                date(2026, 3, 4),
+                date(2025, 1, 1),
+            ],
+            "days_since_issue": [10, 20, 30, np.nan, 40, 50],
+            "invoice_type": ["Regular", "One Shot", "Regular", "Regular", "Regular", "Regular"],
+            "payment_status_norm": ["unpaid", "unpaid", "unpaid", "unpaid", "paid", "unpaid"],
+            "buyer_company_name": [
+                "12433087 Canada Inc",
+                "Client A",
+                "Client A",
+                "Client A",
+                "Client A",
+                "Client A",
+            ],
+            "vendor_company_name": ["12433087 Canada Inc"] * 6,
+        }
+    )
+
+
+def make_filters(**overrides):
+    values = dict(
+        issue_from=date(2026, 1, 1),
+        issue_to=date(2026, 12, 31),
+        aging_min=0,
+        aging_max=365,
+        invoice_type="All",
+        internal_external=["Internal", "External"],
+        buyer_selected=[],
+        vendor_selected=[],
+    )
+    values.update(overrides)
+    return Filters(**values)
+
+
+class ApplyFiltersTests(unittest.TestCase):
+    def test_drops_paid_missing_and_out_of_range_rows(self):
+        out = apply_filters(filter_frame(), make_filters())
+
+        self.assertEqual(out["invoice_id"].tolist(), [1, 2])
+
+    def test_bounds_spanning_all_rows_match_explicit_bounds(self):
+        df = filter_frame()
+
+        wide = apply_filters(
+            df, make_filters(issue_from=date(2020, 1, 1), aging_min=-1000, aging_max=1000)
+        )
+        exact = apply_filters(
+            df,
+            make_filters(
+                issue_from=date(2025, 1, 1),
+                issue_to=date(2026, 3, 4),
+                aging_min=10,
+                aging_max=50,
+                internal_external=["External"],
+            ),
+        )
+
+        self.assertEqual(wide["invoice_id"].tolist(), [1, 2, 6])
+        self.assertEqual(exact["invoice_id"].tolist(), [2, 6])
+
+    def test_invoice_type_and_buyer_selection(self):
+        out = apply_filters(
+            filter_frame(),
+            make_filters(invoice_type="Regular", buyer_selected=["12433087 Canada Inc"]),
+        )
+
+        self.assertEqual(out["invoice_id"].tolist(), [1])
+
+    def test_internal_external_uses_vendor_company_numbers(self):
+        df = filter_frame()
+
+        internal = apply_filters(df, make_filters(internal_external=["Internal"]))
+        external = apply_filters(df, make_filters(internal_external=["External"]))
+
+        self.assertEqual(internal["invoice_id"].tolist(), [1])
+        self.assertEqual(external["invoice_id"].tolist(), [2])
+
+
+class CascadingOptionsTests(unittest.TestCase):
+    def test_options_follow_base_filters_and_other_selection(self):
+        cols = build_filter_columns(filter_frame())
+        base = (date(2026, 1, 1), date(2026, 12, 31), 0, 365, "All", ("Internal", "External"))
+
+        buyers, vendors = _cascading_options(cols, cols.dataset_key, *base, (), ())
+        self.assertEqual(buyers, ["12433087 Canada Inc", "Client A"])
+        self.assertEqual(vendors, ["12433087 Canada Inc"])
+
+        buyers, vendors = _cascading_options(cols, cols.dataset_key, *base, ("Other Vendor",), ())
+        self.assertEqual(buyers, [])
+        self.assertEqual(vendors, ["12433087 Canada Inc"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,299 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+from downloads.cnet_invoice_zip import (
+    PDF_CACHE_MAX_AGE_SECONDS,
+    build_past_due_invoices_zip_by_vendor_buyer,
+    extract_csrf_from_login,
+    find_pdf_link,
+)
+from invoices_export.cnet_client import CNetCredentials, CNetSessionExpired
+
+
+class FakeResponse:
+    def __init__(self, text="", content=b"", status_code=200, headers=None, url=""):
+        self.text = text
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = url
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+
+class FakeSession:
+    def mount(self, *_args, **_kwargs):
+        pass
+
+    def get(self, url, **_kwargs):
+        if url.endswith("/1001/show"):
+            return FakeResponse(text='<a href="/pdf/1001.pdf">Download PDF</a>')
+        if url.endswith("/1002/show"):
+            return FakeResponse(text="<p>No document</p>")
+        if url.endswith("/pdf/1001.pdf"):
+            return FakeResponse(content=b"%PDF-1001")
+        return FakeResponse(status_code=500)
+
+
+def zip_frame():
+    return pd.DataFrame(
+        {
+            "invoice_id": [1001, 1002, 1003],
+            "vendor_company_name": ["Vendor / A", "Vendor / A", None],
+            "buyer_company_name": ["Buyer: A", "Buyer B", "Buyer C"],
+            "work_description": ["Window cleaning", None, ""],
+        }
+    )
+
+
+LOGIN_FORM = """
+<form action="/login_check" method="post">
+  <input type="hidden" name="_csrf_token" value="token">
+  <input type="text" name="_username">
+  <input type="password" name="_password">
+  <input type="submit" name="_submit" value="Log in">
+</form>
+"""
+
+
+class ShowPageParsingTests(unittest.TestCase):
+    def test_find_pdf_link_matches_href_or_link_text_in_document_order(self):
+        html = """
+        <a href="/manager/invoices">Back</a>
+        <a href="/manager/invoices/1/print"> DOWNLOAD </a>
+        <a href="/manager/invoices/1.PDF">File</a>
+        """
+
+        self.assertEqual(find_pdf_link(html), "/manager/invoices/1/print")
+        self.assertEqual(
+            find_pdf_link('<a href="/doc/1">Télécharger <b>PDF</b></a>'),
+            "/doc/1",
+        )
+
+    def test_find_pdf_link_falls_back_to_form_action(self):
+        html = '<a href="/home">Home</a><form action="/invoices/1/Pdf"></form>'
+
+        self.assertEqual(find_pdf_link(html), "/invoices/1/Pdf")
+        self.assertIsNone(find_pdf_link("<p>No document</p>"))
+        self.assertIsNone(find_pdf_link(""))
+
+    def test_extract_csrf_prefers_csrf_token_field(self):
+        html = """
+        <input name="_token" value="fallback">
+        <input name="_csrf_token" value="primary">
+        """
+
+        self.assertEqual(extract_csrf_from_login(html), "primary")
+        self.assertEqual(
+            extract_csrf_from_login('<input name="_token" value="fallback">'),
+            "fallback",
+        )
+        self.assertIsNone(extract_csrf_from_login("<form></form>"))
+
+
+class InvoiceZipTests(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        cache_patch = patch("downloads.cnet_invoice_zip.PDF_CACHE_DIR", cache_dir.name)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+
+    @patch("downloads.cnet_invoice_zip.login", return_value=FakeSession())
+    def test_zip_contains_pdfs_and_failure_markers_by_vendor_buyer(self, _login):
+        zip_bytes, zip_name = build_past_due_invoices_zip_by_vendor_buyer(
+            zip_frame(),
+            CNetCredentials(user="user", password="secret"),
+        )
+
+        self.assertTrue(zip_name.endswith(".zip"))
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            names = z.namelist()
+            self.assertEqual(
+                names,
+                [
+                    "Vendor___A/Buyer__A/invoice_1001_Window_cleaning.pdf",
+                    "Vendor___A/Buyer_B/FAILED_NO_PDF_LINK_1002.txt",
+                    "null/Buyer_C/FAILED_SHOW_1003.txt",
+                ],
+            )
+            self.assertEqual(z.read(names[0]), b"%PDF-1001")
+            self.assertEqual(z.getinfo(names[0]).compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(z.getinfo(names[1]).compress_type, zipfile.ZIP_DEFLATED)
+
+    @patch("downloads.cnet_invoice_zip.login", return_value=FakeSession())
+    def test_failure_markers_can_be_disabled(self, _login):
+        zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(
+            zip_frame(),
+            CNetCredentials(user="user", password="secret"),
+            include_fail_markers=False,
+        )
+
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            self.assertEqual(
+                z.namelist(),
+                ["Vendor___A/Buyer__A/invoice_1001_Window_cleaning.pdf"],
+            )
+
+    def test_second_build_reads_pdfs_from_cache(self):
+        creds = CNetCredentials(user="user", password="secret")
+        build_past_due_invoices_zip_by_vendor_buyer(zip_frame(), session=FakeSession())
+
+        offline = FakeSession()
+        offline.get = lambda url, **_kwargs: FakeResponse(status_code=500)
+        zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(
+            zip_frame(), creds, include_fail_markers=False, session=offline
+        )
+
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            self.assertEqual(
+                z.read("Vendor___A/Buyer__A/invoice_1001_Window_cleaning.pdf"),
+                b"%PDF-1001",
+            )
+
+    def test_expired_cache_entry_is_downloaded_again(self):
+        frame = zip_frame().head(1)
+        build_past_due_invoices_zip_by_vendor_buyer(frame, session=FakeSession())
+        cached_path = os.path.join(self.cache_dir, "1001.pdf")
+        downloaded_at = time.time() - 60
+        os.utime(cached_path, (downloaded_at, downloaded_at))
+
+        # A cache hit keeps the download time, so frequent use never keeps an entry fresh
+        build_past_due_invoices_zip_by_vendor_buyer(frame, session=FakeSession())
+        self.assertEqual(os.stat(cached_path).st_mtime, downloaded_at)
+
+        expired = time.time() - PDF_CACHE_MAX_AGE_SECONDS - 60
+        os.utime(cached_path, (time.time(), expired))
+        corrected = FakeSession()
+        corrected.get = lambda url, **_kwargs: (
+            FakeResponse(content=b"%PDF-1001-corrected")
+            if url.endswith(".pdf")
+            else FakeSession().get(url)
+        )
+        zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(frame, session=corrected)
+
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            self.assertEqual(
+                z.read("Vendor___A/Buyer__A/invoice_1001_Window_cleaning.pdf"),
+                b"%PDF-1001-corrected",
+            )
+        with open(cached_path, "rb") as f:
+            self.assertEqual(f.read(), b"%PDF-1001-corrected")
+
+    def test_html_served_as_pdf_is_a_failure_and_never_cached(self):
+        login_page = FakeSession()
+        login_page.get = lambda url, **_kwargs: (
+            FakeResponse(text='<a href="/pdf/1001.pdf">Download PDF</a>')
+            if url.endswith("/show")
+            else FakeResponse(
+                content=b"<html>Please log in</html>",
+                headers={"Content-Type": "text/html; charset=UTF-8"},
+            )
+        )
+        untyped_html = FakeSession()
+        untyped_html.get = lambda url, **_kwargs: (
+            FakeResponse(text='<a href="/pdf/1001.pdf">Download PDF</a>')
+            if url.endswith("/show")
+            else FakeResponse(content=b"<html>Error</html>")
+        )
+        frame = zip_frame().head(1)
+
+        for session in (login_page, untyped_html):
+            zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(frame, session=session)
+            with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+                self.assertEqual(z.namelist(), ["Vendor___A/Buyer__A/FAILED_PDF_1001.txt"])
+
+        zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(frame, session=FakeSession())
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            self.assertEqual(
+                z.read("Vendor___A/Buyer__A/invoice_1001_Window_cleaning.pdf"), b"%PDF-1001"
+            )
+
+    def test_expired_session_raises_instead_of_writing_failure_markers(self):
+        expired = FakeSession()
+        expired.get = lambda url, **_kwargs: FakeResponse(
+            text=LOGIN_FORM, url="https://app.master.cnetfranchise.com/login"
+        )
+        pdf_expired = FakeSession()
+        pdf_expired.get = lambda url, **_kwargs: (
+            FakeResponse(text='<a href="/pdf/1001.pdf">Download PDF</a>', url=url)
+            if url.endswith("/show")
+            else FakeResponse(
+                content=b"%PDF-login", url="https://app.master.cnetfranchise.com/login"
+            )
+        )
+
+        for session in (expired, pdf_expired):
+            with self.assertRaises(CNetSessionExpired):
+                build_past_due_invoices_zip_by_vendor_buyer(zip_frame(), session=session)
+
+        # Nothing from the expired session was cached
+        zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(
+            zip_frame().head(1), session=FakeSession()
+        )
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            self.assertEqual(
+                z.read("Vendor___A/Buyer__A/invoice_1001_Window_cleaning.pdf"), b"%PDF-1001"
+            )
+
+    @unittest.skipIf(resource is None, "needs resource.setrlimit")
+    def test_cached_pdfs_beyond_the_open_file_limit_are_all_zipped(self):
+        fd_limit = 128
+        count = 3 * fd_limit
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        for inv_id in range(count):
+            with open(os.path.join(cache_dir.name, f"{inv_id}.pdf"), "wb") as f:
+                f.write(b"%PDF-" + str(inv_id).encode())
+        frame = pd.DataFrame(
+            {
+                "invoice_id": range(count),
+                "vendor_company_name": "Vendor",
+                "buyer_company_name": "Buyer",
+            }
+        )
+        offline = FakeSession()
+        offline.get = lambda url, **_kwargs: FakeResponse(status_code=500)
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (fd_limit, hard))
+        try:
+            with patch("downloads.cnet_invoice_zip.PDF_CACHE_DIR", cache_dir.name):
+                zip_bytes, _ = build_past_due_invoices_zip_by_vendor_buyer(frame, session=offline)
+        finally:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+        with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+            names = z.namelist()
+            self.assertEqual(len(names), count)
+            self.assertTrue(all(name.endswith(".pdf") for name in names))
+            self.assertEqual(z.read("Vendor/Buyer/invoice_7_document.pdf"), b"%PDF-7")
+
+
+if __name__ == "__main__":
+    unittest.main()
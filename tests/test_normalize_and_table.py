@@ -9,7 +9,11 @@ from invoices_export.ui.normalize import (
     safe_aging_bounds,
     safe_issue_bounds,
 )
-from invoices_export.ui.table import render_past_due_table
+from invoices_export.ui.table import (
+    STYLED_TABLE_MAX_ROWS,
+    _gradient_css,
+    render_past_due_table,
+)
 
 
 MONETARY_COLUMNS = [
@@ -71,7 +75,10 @@ class NormalizeTests(unittest.TestCase):
     def test_normalize_invoices_converts_types_and_defaults(self):
         result = normalize_invoices(raw_invoice_frame())
 
-        self.assertEqual(result.loc[0, "issue_date"], date(2026, 7, 1))
+        self.assertEqual(result.loc[0, "issue_date"], pd.Timestamp(2026, 7, 1))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(result["issue_date"]))
+        self.assertEqual(result.loc[0, "days_since_issue"], 22)
+        self.assertEqual(result["days_since_issue"].dtype, "Int32")
         self.assertEqual(result.loc[0, "total_amount_with_taxes"], 125.50)
         self.assertEqual(result.loc[0, "partial_payments_count"], 2)
         self.assertEqual(result.loc[0, "open_amount_with_taxes"], 100.00)
@@ -89,6 +96,20 @@ class NormalizeTests(unittest.TestCase):
 
         self.assertEqual(result.loc[0, "open_amount_with_taxes"], 125.50)
 
+    def test_buyer_matching_a_vendor_number_is_internal(self):
+        frame = pd.concat([raw_invoice_frame()] * 3, ignore_index=True)
+        frame["buyer_company_name"] = ["9359-6633 Quebec Inc", "Outside Co", None]
+        frame["vendor_company_name"] = ["9359-6633 Quebec Inc", "Vendor A", "Vendor B"]
+
+        result = normalize_invoices(frame)
+
+        self.assertEqual(result["is_internal"].tolist(), [True, False, False])
+
+    def test_safe_issue_bounds_return_dates(self):
+        result = normalize_invoices(raw_invoice_frame())
+
+        self.assertEqual(safe_issue_bounds(result), (date(2026, 7, 1), date(2026, 7, 1)))
+
     def test_safe_bounds_handle_missing_values(self):
         frame = pd.DataFrame(
             {
@@ -138,6 +159,44 @@ class TableRenderingTests(unittest.TestCase):
         self.assertNotIn("open_amount_with_taxes", displayed.columns)
         self.assertNotIn("partial_payments_amount", displayed.columns)
 
+    @patch("invoices_export.ui.table.st.dataframe")
+    @patch("invoices_export.ui.table.st.subheader")
+    @patch("invoices_export.ui.table.st.divider")
+    def test_large_table_uses_column_config_instead_of_styler(
+        self,
+        _divider,
+        _subheader,
+        dataframe,
+    ):
+        rows = STYLED_TABLE_MAX_ROWS + 1
+        frame = pd.DataFrame(
+            {
+                "invoice_id": range(rows),
+                "past_due": [True, False] * (rows // 2) + [True],
+                "days_since_issue": range(rows),
+                "total_amount_with_taxes": 10.0,
+            }
+        )
+
+        render_past_due_table(frame)
+
+        displayed = dataframe.call_args.args[0]
+        column_config = dataframe.call_args.kwargs["column_config"]
+        self.assertIsInstance(displayed, pd.DataFrame)
+        self.assertEqual(displayed.loc[0, "past_due"], "Past Due")
+        self.assertIn("days_since_issue", column_config)
+        self.assertIn("total_amount_with_taxes", column_config)
+
+    def test_gradient_css_matches_styler_background_gradient(self):
+        frame = pd.DataFrame({"days_since_issue": [-30, 0, 15, None, 120]}, dtype="Int32")
+
+        expected = frame.style.background_gradient(cmap="RdBu_r", vmin=-120, vmax=120)
+        actual = frame.style.apply(_gradient_css, cmap="RdBu_r", vmin=-120, vmax=120)
+        expected._compute()
+        actual._compute()
+
+        self.assertEqual(actual.ctx, expected.ctx)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,8 +2,11 @@ import io
 import sys
 import types
 import unittest
+from datetime import date, datetime
+from unittest.mock import MagicMock, patch
 
 import numpy as np
+import openpyxl
 import pandas as pd
 
 # The sync helpers tested here are pure transformations. Stub the optional
@@ -16,10 +19,14 @@ if "supabase" not in sys.modules:
 from pipeline.sync import (
     COLUMN_MAP,
     FEE_COLUMN_MAP,
+    INSERT_BATCH_SIZE,
     _clean_work_descriptions,
+    _insert_in_batches,
     _json_records,
     _prepare_exports,
     _validated_invoice_ids,
+    read_xlsx_first_sheet,
+    upload_invoice_creation_overrides,
 )
 
 
@@ -128,6 +135,107 @@ class PipelineValidationTests(unittest.TestCase):
 
         self.assertEqual(records, [{"finite": 1.5, "nan": None, "infinite": None}])
 
+    def test_json_records_null_nullable_and_string_missing_values(self):
+        records = _json_records(
+            pd.DataFrame(
+                {
+                    "count": pd.array([2, None], dtype="Int64"),
+                    "amount": pd.array([1.25, None], dtype="Float64"),
+                    "name": ["A", None],
+                }
+            )
+        )
+
+        self.assertEqual(
+            records,
+            [
+                {"count": 2, "amount": 1.25, "name": "A"},
+                {"count": None, "amount": None, "name": None},
+            ],
+        )
+
+    def test_insert_in_batches_sends_every_record_once(self):
+        inserted = []
+
+        class FakeQuery:
+            def __init__(self, batch):
+                self.batch = batch
+
+            def execute(self):
+                inserted.append(self.batch)
+
+        class FakeTable:
+            def insert(self, batch):
+                return FakeQuery(batch)
+
+        class FakeSupabase:
+            def table(self, _name):
+                return FakeTable()
+
+        records = [{"invoice_id": i} for i in range(INSERT_BATCH_SIZE * 2 + 1)]
+
+        _insert_in_batches(FakeSupabase(), "invoices_raw", records)
+
+        self.assertEqual(len(inserted), 3)
+        self.assertTrue(all(len(batch) <= INSERT_BATCH_SIZE for batch in inserted))
+        self.assertCountEqual(
+            [row["invoice_id"] for batch in inserted for row in batch],
+            range(len(records)),
+        )
+
+
+class CreationOverrideTests(unittest.TestCase):
+    def upload(self, frame):
+        client = MagicMock()
+        env = {"SUPABASE_URL": "https://example.test", "SUPABASE_SERVICE_ROLE_KEY": "key"}
+        with patch.dict("os.environ", env), patch("pipeline.sync.create_client", return_value=client):
+            count = upload_invoice_creation_overrides(frame)
+        return count, client.table.return_value.upsert.call_args.args[0]
+
+    def test_overrides_normalize_dates_and_keep_last_duplicate(self):
+        count, records = self.upload(
+            pd.DataFrame({"id": [1, 2, 1], "date": [" 2026-07-01", "2026-07-02", "2026-07-03"]})
+        )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            records,
+            [
+                {"invoice_id": 2, "new_creation_date": "2026-07-02"},
+                {"invoice_id": 1, "new_creation_date": "2026-07-03"},
+            ],
+        )
+
+    def test_overrides_reject_missing_and_malformed_dates(self):
+        frame = pd.DataFrame({"id": [1, 2, 3], "date": ["2026-07-01", None, "07/02/2026"]})
+
+        with self.assertRaisesRegex(ValueError, "Must be YYYY-MM-DD"):
+            self.upload(frame)
+
+    def test_xlsx_date_column_mixing_date_cells_and_text_uploads(self):
+        wb = openpyxl.Workbook()
+        sheet = wb.active
+        sheet.append(["invoice_id", "new_creation_date"])
+        sheet.append([1, datetime(2026, 7, 1)])
+        sheet.append([2, "2026-07-02"])
+        sheet.append([3, date(2026, 7, 3)])
+        sheet.append([None, None])
+        buffer = io.BytesIO()
+        wb.save(buffer)
+
+        frame = read_xlsx_first_sheet(buffer.getvalue())
+        count, records = self.upload(frame)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(
+            records,
+            [
+                {"invoice_id": 1, "new_creation_date": "2026-07-01"},
+                {"invoice_id": 2, "new_creation_date": "2026-07-02"},
+                {"invoice_id": 3, "new_creation_date": "2026-07-03"},
+            ],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
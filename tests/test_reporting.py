@@ -1,6 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
 from pathlib import Path
 import tempfile
 import unittest
+from unittest.mock import patch
+import zipfile
 
 import pandas as pd
 
@@ -8,8 +12,9 @@ from invoices_export.ui.reports import (
     REPORT_DETAIL_COLUMNS_TO_HIDE,
     _prepare_report_amount_columns,
     _report_hidden_columns,
+    generate_partitioned_reports_zip_to_session,
 )
-from reporting.report import ClientReportGenerator, sanitize_path_part
+from reporting.report import RENDER_WINDOW, ClientReportGenerator, _grouped_rows, sanitize_path_part
 
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
@@ -105,6 +110,141 @@ class ReportTests(unittest.TestCase):
                 self.assertNotIn("data-print-orientation", html)
                 self.assertNotIn("applyPrintOrientation", html)
 
+    def test_partition_index_escapes_vendor_and_buyer_names(self):
+        frame = _prepare_report_amount_columns(report_frame())
+        frame["vendor_company_name"] = "<b>Vendor & Co</b>"
+        with tempfile.TemporaryDirectory() as tmp:
+            generator = ClientReportGenerator(TEMPLATE_DIR, tmp)
+            root = generator.generate_html_partitioned(
+                frame,
+                "buyer_company_name",
+                "total_amount_with_taxes",
+                output_root_name="partitioned",
+                hide_columns=_report_hidden_columns(),
+            )
+
+            index_html = (root / "index.html").read_text(encoding="utf-8")
+
+        self.assertIn("&lt;b&gt;Vendor &amp; Co&lt;/b&gt;", index_html)
+        self.assertNotIn("<b>Vendor", index_html)
+        self.assertIn("<td>100.00</td>", index_html)
+
+    def test_partitioned_zip_matches_folder_tree(self):
+        frame = pd.concat([report_frame()] * 3, ignore_index=True)
+        frame["buyer_company_name"] = ["Buyer: A", "Buyer B", "Buyer: A"]
+        frame = _prepare_report_amount_columns(frame)
+        with tempfile.TemporaryDirectory() as tmp:
+            generator = ClientReportGenerator(TEMPLATE_DIR, tmp)
+            root = generator.generate_html_partitioned(
+                frame,
+                "buyer_company_name",
+                "total_amount_with_taxes",
+                output_root_name="partitioned",
+                hide_columns=_report_hidden_columns(),
+            )
+            zip_path = generator.generate_html_partitioned_zip(
+                frame,
+                "buyer_company_name",
+                "total_amount_with_taxes",
+                output_name="partitioned.zip",
+                hide_columns=_report_hidden_columns(),
+            )
+
+            expected = {
+                p.relative_to(root).as_posix(): p.read_text(encoding="utf-8")
+                for p in root.rglob("*")
+                if p.is_file()
+            }
+            with zipfile.ZipFile(zip_path) as zf:
+                actual = {name: zf.read(name).decode("utf-8") for name in zf.namelist()}
+
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(actual, expected)
+
+    @patch("invoices_export.ui.reports.st.spinner")
+    def test_each_session_gets_its_own_partitioned_zip(self, _spinner):
+        frame = report_frame()
+        with tempfile.TemporaryDirectory() as tmp:
+            generator = ClientReportGenerator(TEMPLATE_DIR, tmp)
+            paths = []
+            for session in ({}, {}):
+                with patch("invoices_export.ui.reports.st.session_state", session):
+                    generate_partitioned_reports_zip_to_session(frame, generator)
+                    generate_partitioned_reports_zip_to_session(frame, generator)
+                paths.append(session["reports_zip_path"])
+                self.assertEqual(session["reports_zip_name"], "reports_by_vendor_buyer.zip")
+
+            self.assertNotEqual(paths[0], paths[1])
+            self.assertEqual(
+                sorted(p.name for p in Path(tmp).iterdir()),
+                sorted(Path(p).name for p in paths),
+            )
+
+    def test_concurrent_zip_generations_do_not_share_a_temp_file(self):
+        frames = []
+        for buyer in ("Buyer A", "Buyer B"):
+            frame = pd.concat([report_frame()] * 40, ignore_index=True)
+            frame["buyer_company_name"] = [f"{buyer} {i}" for i in range(40)]
+            frames.append(_prepare_report_amount_columns(frame))
+        with tempfile.TemporaryDirectory() as tmp:
+            generator = ClientReportGenerator(TEMPLATE_DIR, tmp)
+
+            def generate(frame):
+                return generator.generate_html_partitioned_zip(
+                    frame,
+                    "buyer_company_name",
+                    "total_amount_with_taxes",
+                    output_name="shared.zip",
+                    hide_columns=_report_hidden_columns(),
+                )
+
+            with ThreadPoolExecutor(2) as executor:
+                zip_paths = list(executor.map(generate, frames))
+
+            self.assertEqual([p.name for p in Path(tmp).iterdir()], ["shared.zip"])
+            with zipfile.ZipFile(zip_paths[0]) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(len(zf.namelist()), 41)
+
+    def test_partitioned_folder_holds_at_most_a_window_of_contexts(self):
+        count = 4 * RENDER_WINDOW
+        frame = pd.concat([report_frame()] * count, ignore_index=True)
+        frame["buyer_company_name"] = [f"Buyer {i}" for i in range(count)]
+        frame = _prepare_report_amount_columns(frame)
+        release = threading.Event()
+        built = []
+
+        with tempfile.TemporaryDirectory() as tmp:
+            generator = ClientReportGenerator(TEMPLATE_DIR, tmp)
+            template = generator._tpl("report_partition.html")
+            partitions = generator._partitions
+
+            def counted_partitions(*args):
+                for part in partitions(*args):
+                    built.append(part[0])
+                    yield part
+
+            def blocked_render(**context):
+                release.wait(5)
+                return template.render(**context)
+
+            with patch.object(generator, "_partitions", counted_partitions), patch.object(
+                generator, "_tpl", return_value=type("Tpl", (), {"render": staticmethod(blocked_render)})
+            ):
+                worker = threading.Thread(
+                    target=generator.generate_html_partitioned,
+                    args=(frame, "buyer_company_name", "total_amount_with_taxes"),
+                )
+                worker.start()
+                worker.join(0.3)  # renders are blocked, so group building must stall
+                held = len(built)
+                release.set()
+                worker.join()
+
+            self.assertEqual(held, RENDER_WINDOW)
+            self.assertEqual(len(built), count)
+            self.assertEqual(len(list(Path(tmp).rglob("report.html"))), count)
+
     def test_partition_paths_are_sanitized(self):
         sanitized = sanitize_path_part("Vendor / A:*?")
 
@@ -114,6 +254,28 @@ class ReportTests(unittest.TestCase):
         self.assertNotIn("*", sanitized)
         self.assertNotIn("?", sanitized)
 
+    def test_grouped_rows_follow_columns_with_missing_values_as_none(self):
+        frame = pd.DataFrame(
+            {
+                "buyer": ["B", "A", "B", None],
+                "invoice_id": ["INV-1", "INV-2", "INV-3", "INV-4"],
+                "days_since_issue": pd.array([12, None, 7, 3], dtype="Int32"),
+                "issue_date": pd.to_datetime(["2026-07-01", None, "2026-07-03", None]),
+                "total_amount_with_taxes": [110.0, float("nan"), 5.0, 1.0],
+            }
+        )
+        columns = ["invoice_id", "days_since_issue", "issue_date", "total_amount_with_taxes"]
+        groups = frame.groupby("buyer")
+
+        rows = list(_grouped_rows(groups, columns))
+
+        expected = [
+            [tuple(r.values()) for r in g[columns].to_dict(orient="records")] for _, g in groups
+        ]
+        self.assertEqual(repr([[tuple(r) for r in group] for group in rows]), repr(expected))
+        self.assertEqual(rows[1][0].invoice_id, "INV-1")
+        self.assertIsNone(rows[0][0].days_since_issue)
+
 
 if __name__ == "__main__":
     unittest.main()